@@ -3,12 +3,152 @@ from tkinter import messagebox, filedialog
 from PIL import Image, ImageTk
 import sqlite3
 import os
-import cv2
-import face_recognition
-import numpy as np
-import pandas as pd
+import csv
+import io
+import hashlib
+import ctypes
+import ctypes.util
+import select
+import struct
+import sys
+import tempfile
+import argparse
+import json
+import logging
+import urllib.request
+import importlib
 from datetime import datetime
+from contextlib import contextmanager
+from bisect import bisect_left
+from logging.handlers import RotatingFileHandler
 import threading
+import atexit
+import queue
+import time
+from multiprocessing import resource_tracker, shared_memory
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+# ------------------------------------------------------------
+# Importación diferida de módulos pesados
+# ------------------------------------------------------------
+class _LazyModule:
+    """
+    Se importa el módulo real la primera vez que se usa uno de sus atributos
+    y se reemplaza a sí mismo en el espacio global, de modo que después no
+    queda ningún costo extra. cv2, face_recognition (que carga los modelos de
+    dlib), numpy y pandas tardan en importarse y el login no los necesita.
+    """
+    def __init__(self, name, alias=None):
+        self._name = name
+        self._alias = alias or name
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            module = importlib.import_module(self._name)
+            if globals().get(self._alias) is self:
+                globals()[self._alias] = module
+            return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        return f"<módulo diferido {self._name!r}>"
+
+cv2 = _LazyModule("cv2")
+face_recognition = _LazyModule("face_recognition")
+np = _LazyModule("numpy", "np")
+pd = _LazyModule("pandas", "pd")
+
+# Errores de los hilos en segundo plano; sin configurar logging se muestran en stderr
+logger = logging.getLogger("attendance")
+
+# ------------------------------------------------------------
+# Acceso a la base de datos
+# ------------------------------------------------------------
+DB_PATH = "database/attendance.db"
+
+class Database:
+    """
+    Capa única de acceso a attendance.db. Cada hilo usa su propia conexión
+    persistente (sqlite3 no permite compartirlas entre hilos) en modo WAL, de
+    modo que los hilos de reconocimiento pueden leer mientras otro escribe.
+    Las sentencias se reutilizan desde la caché de sentencias preparadas de
+    sqlite3 y las escrituras en lote se agrupan con transaction().
+    """
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    def connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None: las transacciones se abren explícitamente
+            conn = sqlite3.connect(self.path, isolation_level=None, cached_statements=256)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA cache_size=-16000")     # 16 MB
+            conn.execute("PRAGMA mmap_size=268435456")   # 256 MB
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+            self._local.depth = 0
+        return conn
+
+    def execute(self, sql, params=()):
+        return self.connection().execute(sql, params)
+
+    def executemany(self, sql, rows):
+        return self.connection().executemany(sql, rows)
+
+    def fetchone(self, sql, params=()):
+        return self.execute(sql, params).fetchone()
+
+    def fetchall(self, sql, params=()):
+        return self.execute(sql, params).fetchall()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Agrupa varias escrituras en una sola transacción (un solo commit). Se
+        abre con BEGIN IMMEDIATE: el bloqueo de escritura se toma al inicio y
+        busy_timeout lo espera. Con un BEGIN diferido, una lectura seguida de
+        una escritura falla con "database is locked" si otra conexión (por
+        ejemplo el hilo del log de auditoría) confirmó entre ambas.
+        """
+        conn = self.connection()
+        if self._local.depth:
+            # Transacción anidada: se integra en la exterior
+            self._local.depth += 1
+            try:
+                yield conn
+            finally:
+                self._local.depth -= 1
+            return
+
+        conn.execute("BEGIN IMMEDIATE")
+        self._local.depth = 1
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+        finally:
+            self._local.depth = 0
+
+    def close(self):
+        """Cierra la conexión del hilo actual."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+db = Database()
 
 # ------------------------------------------------------------
 # Funciones de inicialización y logging
@@ -18,9 +158,7 @@ def create_logs_table():
     Conecta a la base de datos existente (attendance.db) y crea
     únicamente la tabla 'logs' si no existe.
     """
-    conn = sqlite3.connect("database/attendance.db")
-    cursor = conn.cursor()
-    cursor.execute("""
+    db.execute("""
         CREATE TABLE IF NOT EXISTS logs (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             username TEXT NOT NULL,
@@ -31,30 +169,329 @@ def create_logs_table():
             section  TEXT
         )
     """)
-    conn.commit()
-    conn.close()
+
+def migrate_attendance_date_column():
+    """
+    Agrega a 'attendance' la columna 'date' (YYYY-MM-DD) para no tener que
+    calcular date(timestamp) en cada consulta, crea el índice (date,
+    student_code) y completa la fecha de los registros que no la tienen.
+    El índice sirve a las consultas de un día y a las de un alumno en un día;
+    como empieza por 'date', el completado también lo usa y en los inicios
+    siguientes no recorre la tabla.
+    """
+    with db.transaction():
+        columns = [row[1] for row in db.fetchall("PRAGMA table_info(attendance)")]
+        if "date" not in columns:
+            db.execute("ALTER TABLE attendance ADD COLUMN date TEXT")
+        db.execute("DROP INDEX IF EXISTS idx_attendance_code_date")
+        db.execute("CREATE INDEX IF NOT EXISTS idx_attendance_date_code ON attendance (date, student_code)")
+        db.execute("UPDATE attendance SET date = substr(timestamp, 1, 10) WHERE date IS NULL")
+
+LOG_FLUSH_EVERY_N = 50          # Eventos por transacción
+LOG_FLUSH_INTERVAL_MS = 500     # Espera máxima antes de escribir un lote incompleto
+LOG_QUEUE_MAXSIZE = 10000
+LOG_ENQUEUE_TIMEOUT = 0.05      # Si la cola está llena se espera esto y luego se descarta el evento
+
+class AuditLogger:
+    """
+    Escribe los eventos de la tabla 'logs' desde un único hilo en segundo
+    plano, agrupados en una transacción cada LOG_FLUSH_EVERY_N eventos o cada
+    LOG_FLUSH_INTERVAL_MS. La cola es acotada: si se llena, log() espera un
+    momento y, si sigue llena, descarta el evento y lo cuenta en 'dropped'.
+    """
+    def __init__(self, flush_every=LOG_FLUSH_EVERY_N, flush_interval_ms=LOG_FLUSH_INTERVAL_MS,
+                 maxsize=LOG_QUEUE_MAXSIZE):
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="audit-logger", daemon=True)
+                self._thread.start()
+
+    def log(self, row):
+        self._ensure_started()
+        try:
+            self._queue.put(row, timeout=LOG_ENQUEUE_TIMEOUT)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout=5.0):
+        """Espera a que se escriban todos los eventos encolados hasta ahora."""
+        if self._thread is None:
+            return
+        done = threading.Event()
+        self._queue.put(("flush", done))
+        done.wait(timeout)
+
+    def close(self):
+        if self._thread is None:
+            return
+        done = threading.Event()
+        self._queue.put(("stop", done))
+        done.wait(5.0)
+
+    def _write(self, batch):
+        if not batch:
+            return
+        try:
+            with db.transaction():
+                db.executemany("""
+                    INSERT INTO logs (username, action, date, time, grade, section)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, batch)
+        except sqlite3.Error:
+            self.dropped += len(batch)
+        batch.clear()
+
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                self._write(batch)
+                deadline = None
+                continue
+
+            if item[0] in ("flush", "stop"):
+                self._write(batch)
+                deadline = None
+                if item[0] == "stop":
+                    # La conexión es de este hilo: solo él puede cerrarla
+                    db.close()
+                    item[1].set()
+                    return
+                item[1].set()
+                continue
+
+            batch.append(item)
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+            if len(batch) >= self.flush_every:
+                self._write(batch)
+                deadline = None
+
+audit_logger = AuditLogger()
+atexit.register(audit_logger.close)
 
 def log_event(username, action, grade, section):
     """
-    Inserta un registro en la tabla 'logs' con fecha, hora, usuario, acción, grado y sección.
+    Encola un registro para la tabla 'logs' con fecha, hora, usuario, acción,
+    grado y sección. Vuelve de inmediato; lo escribe el hilo de AuditLogger.
     """
     now = datetime.now()
     date_str = now.strftime("%Y-%m-%d")
     time_str = now.strftime("%H:%M:%S")
-    conn = sqlite3.connect("database/attendance.db")
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO logs (username, action, date, time, grade, section)
-        VALUES (?, ?, ?, ?, ?, ?)
-    """, (username, action, date_str, time_str, grade, section))
-    conn.commit()
-    conn.close()
+    audit_logger.log((username, action, date_str, time_str, grade, section))
+
+def close_window(master):
+    """Cierra la ventana actual al navegar a otra, escribiendo antes los logs pendientes."""
+    audit_logger.flush()
+    master.destroy()
+
+# ------------------------------------------------------------
+# Métricas de rendimiento por etapa
+# ------------------------------------------------------------
+METRICS_ENABLED = os.environ.get("ATTENDANCE_METRICS") == "1"
+METRICS_LOG_FILENAME = "metrics.jsonl"
+METRICS_LOG_MAX_BYTES = 1_000_000
+METRICS_LOG_BACKUPS = 5
+METRICS_EXPORT_INTERVAL_SECONDS = 60
+
+class LatencyHistogram:
+    """Histograma de latencias con cubetas fijas que se duplican desde 0,05 ms."""
+    BOUNDS_MS = [0.05 * 2 ** k for k in range(20)]  # 0,05 ms .. ~26 s
+
+    def __init__(self):
+        self.buckets = [0] * (len(self.BOUNDS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms):
+        self.buckets[bisect_left(self.BOUNDS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def percentile(self, q):
+        """Cota superior de la cubeta que contiene el percentil q (0-100)."""
+        if not self.count:
+            return 0.0
+        target = self.count * q / 100.0
+        seen = 0
+        for bound, n in zip(self.BOUNDS_MS + [self.max_ms], self.buckets):
+            seen += n
+            if seen >= target:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def summary(self):
+        return {"count": self.count,
+                "mean_ms": self.total_ms / self.count if self.count else 0.0,
+                "p50_ms": self.percentile(50), "p95_ms": self.percentile(95),
+                "max_ms": self.max_ms}
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+class _StageTimer:
+    __slots__ = ("metrics", "stage", "start")
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+class Metrics:
+    """
+    Contadores e histogramas de latencia de las etapas del reconocimiento
+    (decodificación, face_locations, face_encodings, comparación, consulta de
+    asistencia y registro). Desactivado, timer() devuelve un contexto vacío
+    compartido y count() vuelve de inmediato, así que el costo es una
+    comprobación por llamada. Activado, cada METRICS_EXPORT_INTERVAL_SECONDS
+    se agrega una línea JSON con los totales a un archivo rotativo.
+    Las métricas son por proceso: las etapas que corren en procesos
+    trabajadores se miden allí y el proceso principal registra su duración.
+    """
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.histograms = {}
+        self.counters = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._logger = None
+        self._exporter = None
+
+    def timer(self, stage):
+        if not self.enabled:
+            return _NULL_TIMER
+        return _StageTimer(self, stage)
+
+    def observe(self, stage, seconds):
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = LatencyHistogram()
+            histogram.observe(seconds * 1000.0)
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def snapshot(self):
+        with self._lock:
+            return {"time": datetime.now().isoformat(timespec="seconds"),
+                    "since": datetime.fromtimestamp(self.started).isoformat(timespec="seconds"),
+                    "stages": {stage: h.summary() for stage, h in self.histograms.items()},
+                    "counters": dict(self.counters)}
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+            self.counters = {}
+            self.started = time.time()
+
+    def enable(self, log_path=None):
+        """Activa la medición; con log_path exporta periódicamente a JSON lines."""
+        self.enabled = True
+        if log_path and self._logger is None:
+            handler = RotatingFileHandler(log_path, maxBytes=METRICS_LOG_MAX_BYTES,
+                                          backupCount=METRICS_LOG_BACKUPS, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self._logger = logging.getLogger("attendance.metrics")
+            self._logger.setLevel(logging.INFO)
+            self._logger.propagate = False
+            self._logger.addHandler(handler)
+            self._exporter = threading.Thread(target=self._export_loop, name="metrics-exporter", daemon=True)
+            self._exporter.start()
+            atexit.register(self.export)
+
+    def disable(self):
+        self.enabled = False
+
+    def export(self):
+        """Escribe una línea JSON con los totales actuales, si hay algo medido."""
+        if self._logger is None or not (self.histograms or self.counters):
+            return
+        self._logger.info(json.dumps(self.snapshot(), ensure_ascii=False))
+
+    def _export_loop(self):
+        while True:
+            time.sleep(METRICS_EXPORT_INTERVAL_SECONDS)
+            if self.enabled:
+                self.export()
+
+metrics = Metrics()
+
+def enable_metrics():
+    """Activa las métricas exportando a metrics.jsonl junto al script."""
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    metrics.enable(os.path.join(script_dir, METRICS_LOG_FILENAME))
+
+# ------------------------------------------------------------
+# Precarga de modelos y galería en segundo plano
+# ------------------------------------------------------------
+_warm_up_thread = None
+
+def _warm_up(dataset_dir):
+    try:
+        with metrics.timer("warm_up"):
+            # Importa cv2/numpy/pandas y carga los modelos de dlib con una detección vacía
+            face_recognition.face_locations(np.zeros((64, 64, 3), dtype=np.uint8))
+            cv2.cvtColor(np.zeros((1, 1, 3), dtype=np.uint8), cv2.COLOR_BGR2RGB)
+            pd.DataFrame
+            # Codifica las imágenes nuevas de dataset/ y carga la galería compartida;
+            # con --server la galería vive en el servicio y no se carga aquí
+            if os.path.isdir(dataset_dir) and not RECOGNITION_SERVER_URL:
+                get_recognition_engine().load()
+    except Exception:
+        # Se vuelve a intentar al abrir la ventana de asistencia
+        logger.warning("La precarga de modelos y galería falló", exc_info=True)
+
+def warm_up_in_background(dataset_dir):
+    """Prepara modelos y galería mientras el usuario inicia sesión (una sola vez)."""
+    global _warm_up_thread
+    if _warm_up_thread is None:
+        _warm_up_thread = threading.Thread(target=_warm_up, args=(dataset_dir,), name="warm-up", daemon=True)
+        _warm_up_thread.start()
+
+def wait_for_warm_up(timeout=None):
+    if _warm_up_thread is not None:
+        _warm_up_thread.join(timeout)
 
 # ------------------------------------------------------------
 # Función para volver al login principal
 # ------------------------------------------------------------
 def run_login():
     create_logs_table()  # Asegura que exista la tabla 'logs'
+    migrate_attendance_date_column()
     root = tk.Tk()
     app = LoginApp(root)
     root.mainloop()
@@ -88,6 +525,9 @@ class LoginApp:
         self.label_title = tk.Label(master, text="Inicio de Sesión", font=("Helvetica", 16), bg='#add8e6')
         self.label_title.pack(pady=20)
 
+        # Modelos y galería se cargan en segundo plano, una vez dibujada la ventana
+        master.after_idle(lambda: warm_up_in_background(os.path.join(script_dir, "dataset")))
+
         self.label_user = tk.Label(master, text="Usuario:", bg='#add8e6')
         self.label_user.pack(pady=(10,0))
         self.entry_user = tk.Entry(master)
@@ -113,17 +553,12 @@ class LoginApp:
         username = self.entry_user.get()
         password = self.entry_pass.get()
 
-        conn = sqlite3.connect("database/attendance.db")
-        cursor = conn.cursor()
-        cursor.execute(
+        result_users = db.fetchone(
             "SELECT role, assigned_grade, assigned_section FROM users WHERE username=? AND password=?",
             (username, password))
-        result_users = cursor.fetchone()
-        cursor.execute(
+        result_admin = db.fetchone(
             "SELECT role FROM admin WHERE username=? AND password=?",
             (username, password))
-        result_admin = cursor.fetchone()
-        conn.close()
 
         if result_users or result_admin:
             if result_users:
@@ -136,7 +571,7 @@ class LoginApp:
             log_event(username, "Iniciar sesión", grade if grade else "", section if section else "")
 
             messagebox.showinfo("Éxito", f"Bienvenido, {username} ({role})")
-            self.master.destroy()
+            close_window(self.master)
 
             if role == "docente":
                 root = tk.Tk()
@@ -195,21 +630,21 @@ class DocenteMenu:
         self.master.config(menu=menubar)
 
     def _logout(self):
-        self.master.destroy()
+        close_window(self.master)
         run_login()
 
     def _go_back_to_login(self):
-        self.master.destroy()
+        close_window(self.master)
         run_login()
 
     def open_register_students(self):
-        self.master.destroy()
+        close_window(self.master)
         root = tk.Tk()
         RegisterStudentApp(root, self.username)
         root.mainloop()
 
     def open_take_attendance(self):
-        self.master.destroy()
+        close_window(self.master)
         root = tk.Tk()
         TakeAttendanceApp(root, self.username)
         root.mainloop()
@@ -255,11 +690,11 @@ class RegisterTeacherApp:
         self.master.config(menu=menubar)
 
     def _logout(self):
-        self.master.destroy()
+        close_window(self.master)
         run_login()
 
     def _go_back_to_login(self):
-        self.master.destroy()
+        close_window(self.master)
         run_login()
 
     def register_teacher(self):
@@ -272,13 +707,10 @@ class RegisterTeacherApp:
             messagebox.showerror("Error", "Todos los campos son obligatorios.")
             return
 
-        conn = sqlite3.connect("database/attendance.db")
-        cursor = conn.cursor()
         try:
-            cursor.execute(
+            db.execute(
                 "INSERT INTO users (username, password, role, assigned_grade, assigned_section) VALUES (?, ?, ?, ?, ?)",
                 (username, password, "docente", grade, section))
-            conn.commit()
             messagebox.showinfo("Éxito", "Docente registrado correctamente.")
             self.username_entry.delete(0, tk.END)
             self.password_entry.delete(0, tk.END)
@@ -286,8 +718,6 @@ class RegisterTeacherApp:
             self.section_entry.delete(0, tk.END)
         except sqlite3.IntegrityError:
             messagebox.showerror("Error", "El nombre de usuario ya existe.")
-        finally:
-            conn.close()
 
 # ------------------------------------------------------------
 # Ventana Registro de Estudiantes
@@ -355,11 +785,11 @@ class RegisterStudentApp:
         self.master.config(menu=menubar)
 
     def _logout(self):
-        self.master.destroy()
+        close_window(self.master)
         run_login()
 
     def _go_back_to_menu_docente(self):
-        self.master.destroy()
+        close_window(self.master)
         root = tk.Tk()
         DocenteMenu(root, self.username)
         root.mainloop()
@@ -378,15 +808,21 @@ class RegisterStudentApp:
             messagebox.showerror("Error", "Debes subir una foto o tomar una con la cámara.")
             return
 
-        conn = sqlite3.connect("database/attendance.db")
-        cursor = conn.cursor()
+        # Se detecta y codifica el rostro una sola vez, al matricular
+        try:
+            encodings = encode_enrollment_photo(self.photo_data)
+        except ValueError as e:
+            messagebox.showerror("Error", f"Foto no válida: {str(e)}")
+            return
+
         try:
-            cursor.execute(
-                "INSERT INTO students (student_code, name, grade, section, photo) VALUES (?, ?, ?, ?, ?)",
-                (code, name, grade, section, self.photo_data))
-            conn.commit()
+            db.execute(
+                "INSERT INTO students (student_code, name, grade, section, photo, dataset) VALUES (?, ?, ?, ?, ?, ?)",
+                (code, name, grade, section, self.photo_data, encodings_to_blob(encodings)))
             log_event(self.username, "Agregar alumno", grade, section)
-            messagebox.showinfo("Éxito", "Alumno registrado con foto guardada en la base de datos.")
+            # Disponible de inmediato para reconocer, sin recargar la galería
+            get_recognition_engine().add_student(code, grade, section, encodings)
+            messagebox.showinfo("Éxito", "Alumno registrado con foto y rostro codificado en la base de datos.")
             self.name_entry.delete(0, tk.END)
             self.code_entry.delete(0, tk.END)
             self.grade_entry.delete(0, tk.END)
@@ -394,8 +830,6 @@ class RegisterStudentApp:
             self.photo_data = None
         except sqlite3.IntegrityError:
             messagebox.showerror("Error", "El código del alumno ya existe.")
-        finally:
-            conn.close()
 
     def capture_photo(self):
         code = self.code_entry.get()
@@ -450,376 +884,2893 @@ class RegisterStudentApp:
             messagebox.showerror("Error", f"Error al cargar foto: {str(e)}")
 
 # ------------------------------------------------------------
-# Ventana Tomar Asistencia (Versión Mejorada)
+# Caché persistente de codificaciones faciales (dataset/)
 # ------------------------------------------------------------
-class TakeAttendanceApp:
-    def __init__(self, master, username):
-        self.master = master
-        self.username = username
+ENCODING_CACHE_FILENAME = "dataset_encodings.npy"
+ENCODING_CACHE_NAME_LENGTH = 255  # Un nombre más largo se truncaría y nunca coincidiría con su archivo
+ENCODING_CACHE_FIELDS = [
+    ("filename", f"U{ENCODING_CACHE_NAME_LENGTH}"),
+    ("size", "<i8"),
+    ("mtime_ns", "<i8"),
+    ("sha1", "S20"),
+    ("has_face", "?"),
+    ("encoding", "<f4", (128,)),
+]
 
-        master.title("Tomar Asistencia - Reconocimiento Facial")
-        master.geometry("750x600")
-        self.create_menu()
+def encoding_cache_dtype():
+    """dtype de la caché; se arma al usarlo para no importar numpy al iniciar."""
+    return np.dtype(ENCODING_CACHE_FIELDS)
 
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        icon_path = os.path.join(script_dir, "assets", "icon.ico")
-        bg_path = os.path.join(script_dir, "assets", "background_image.png")
+class FaceEncodingCache:
+    """
+    Guarda en disco la codificación de cada imagen de dataset/, identificada por
+    nombre de archivo, tamaño, fecha de modificación y hash del contenido.
+    El archivo es un único arreglo estructurado de NumPy (.npy) que se abre con
+    mmap; solo se vuelven a codificar las imágenes nuevas o modificadas y se
+    eliminan las entradas de archivos borrados. Los archivos con nombres de más
+    de ENCODING_CACHE_NAME_LENGTH caracteres se codifican pero no se guardan.
+    """
+    def __init__(self, dataset_dir, cache_path=None):
+        self.dataset_dir = dataset_dir
+        if cache_path is None:
+            cache_path = os.path.join(os.path.dirname(os.path.abspath(dataset_dir)), ENCODING_CACHE_FILENAME)
+        self.cache_path = cache_path
 
+    def load_records(self):
+        """Devuelve las entradas guardadas como {filename: registro}."""
+        if not os.path.exists(self.cache_path):
+            return {}
         try:
-            master.iconbitmap(icon_path)
-        except Exception:
-            pass
+            records = np.load(self.cache_path, mmap_mode="r")
+        except (OSError, ValueError):
+            return {}
+        if records.dtype != encoding_cache_dtype():
+            return {}
+        # Se copian los registros para no mantener el archivo mapeado
+        # (en Windows no se podría reemplazar mientras siga abierto).
+        entries = {str(rec["filename"]): rec.copy() for rec in records}
+        del records
+        return entries
 
-        try:
-            self.bg_image = ImageTk.PhotoImage(file=bg_path)
-            bg_label = tk.Label(master, image=self.bg_image)
-            bg_label.place(x=0, y=0, relwidth=1, relheight=1)
-        except Exception:
-            pass
+    def refresh(self, on_message=None):
+        """
+        Sincroniza la caché con el contenido actual de dataset/ y devuelve
+        (nombres, codificaciones, recalculados, eliminados).
+        """
+        def notify(msg):
+            if on_message is not None:
+                on_message(msg)
 
-        tk.Label(master, text=f"Usuario: {username}", font=("Helvetica", 14), bg='#ffffe0').pack(pady=20)
+        cached = self.load_records()
+        current = {}
+        recomputed = 0
+        dirty = False
 
-        self.btn_upload = tk.Button(master, text="Subir Imagen o Video", width=25, command=self.upload_file)
-        self.btn_upload.pack(pady=5)
+        for filename in sorted(os.listdir(self.dataset_dir)):
+            if not filename.lower().endswith((".jpg", ".png")):
+                continue
+            path = os.path.join(self.dataset_dir, filename)
+            try:
+                st = os.stat(path)
+                rec = cached.get(filename)
+                if rec is not None and rec["size"] == st.st_size and rec["mtime_ns"] == st.st_mtime_ns:
+                    current[filename] = rec
+                    continue
 
-        self.btn_take_photo = tk.Button(master, text="Tomar Foto (Asistencia)", width=25, command=self.take_photo)
-        self.btn_take_photo.pack(pady=5)
+                with open(path, "rb") as f:
+                    content = f.read()
+                digest = hashlib.sha1(content).digest()
+                dirty = dirty or len(filename) <= ENCODING_CACHE_NAME_LENGTH
+                if rec is not None and rec["sha1"] == digest:
+                    # Mismo contenido con otra fecha: solo se actualiza la clave
+                    rec["size"] = st.st_size
+                    rec["mtime_ns"] = st.st_mtime_ns
+                    current[filename] = rec
+                    continue
 
-        self.btn_record_video = tk.Button(master, text="Grabar Video (Asistencia)", width=25, command=self.record_video)
-        self.btn_record_video.pack(pady=5)
+                image = face_recognition.load_image_file(path)
+                encodings = face_recognition.face_encodings(image)
+                rec = np.zeros((), dtype=encoding_cache_dtype())
+                rec["filename"] = filename
+                rec["size"] = st.st_size
+                rec["mtime_ns"] = st.st_mtime_ns
+                rec["sha1"] = digest
+                rec["has_face"] = bool(encodings)
+                if encodings:
+                    rec["encoding"] = encodings[0]
+                current[filename] = rec
+                recomputed += 1
+            except Exception as e:
+                notify(f"Error procesando {filename}: {str(e)}\n")
 
-        self.btn_export = tk.Button(master, text="Exportar Asistencia del Día", width=25, command=self.export_today_attendance)
-        self.btn_export.pack(pady=5)
+        removed = len(set(cached) - set(current))
+        if removed:
+            dirty = True
+        too_long = [filename for filename in current if len(filename) > ENCODING_CACHE_NAME_LENGTH]
+        if too_long:
+            logger.warning("%d archivos de %s tienen nombres de más de %d caracteres y se codifican en cada "
+                           "inicio: %s", len(too_long), self.dataset_dir, ENCODING_CACHE_NAME_LENGTH,
+                           ", ".join(too_long))
+        if dirty:
+            self.save([rec for filename, rec in current.items() if len(filename) <= ENCODING_CACHE_NAME_LENGTH])
 
-        self.text = tk.Text(master, height=10, width=90)
-        self.text.pack(pady=10)
+        names = []
+        encodings = []
+        for filename, rec in current.items():
+            if rec["has_face"]:
+                names.append(os.path.splitext(filename)[0])
+                encodings.append(np.array(rec["encoding"], dtype=np.float64))
+            else:
+                notify(f"No se detectaron rostros en: {filename}\n")
+        return names, encodings, recomputed, removed
 
-        self.dataset_dir = os.path.join(script_dir, "dataset")
-        if not os.path.exists(self.dataset_dir):
-            os.makedirs(self.dataset_dir)
-            self.text.insert(tk.END, "Se creó la carpeta dataset. Por favor agregue fotos de referencia.\n")
+    def save(self, records):
+        """
+        Escribe la caché de forma atómica (archivo temporal + os.replace). Cada
+        escritor usa su propio temporal: load() y el vigilante de dataset/
+        pueden guardar a la vez y gana el último reemplazo, siempre completo.
+        """
+        data = np.zeros(len(records), dtype=encoding_cache_dtype())
+        for i, rec in enumerate(records):
+            data[i] = rec
+        directory, basename = os.path.split(os.path.abspath(self.cache_path))
+        with tempfile.NamedTemporaryFile(dir=directory, prefix=basename + ".", suffix=".tmp", delete=False) as f:
+            tmp_path = f.name
+            try:
+                np.save(f, data)
+            except BaseException:
+                f.close()
+                os.remove(tmp_path)
+                raise
+        os.replace(tmp_path, self.cache_path)
 
-        self.known_face_encodings = []
-        self.known_face_names = []
-        self.load_known_faces()
+# ------------------------------------------------------------
+# Comparación vectorizada contra la galería de rostros conocidos
+# ------------------------------------------------------------
+MATCH_TOLERANCE = 0.5
 
-        self.grade, self.section = self.get_teacher_grade_section()
-        self.recorded_video_path = None
+class FaceMatcher:
+    """
+    Mantiene la galería como una matriz contigua float32 (N x 128) con las
+    normas precalculadas y compara todas las codificaciones de un frame en una
+    sola operación, en lugar de llamar a compare_faces y face_distance por rostro.
+    """
+    def __init__(self, names, encodings, tolerance=MATCH_TOLERANCE):
+        self.names = list(names)
+        self.tolerance = tolerance
+        self.gallery = np.ascontiguousarray(np.asarray(encodings, dtype=np.float32).reshape(-1, 128))
+        self.gallery_sq_norms = np.einsum("ij,ij->i", self.gallery, self.gallery)
 
-    def create_menu(self):
-        menubar = tk.Menu(self.master)
-        opciones = tk.Menu(menubar, tearoff=0)
-        opciones.add_command(label="Cerrar sesión", command=self._logout)
-        opciones.add_command(label="Volver", command=self._go_back_to_menu_docente)
-        menubar.add_cascade(label="Opciones", menu=opciones)
-        self.master.config(menu=menubar)
+    def __len__(self):
+        return len(self.names)
 
-    def _logout(self):
-        self.master.destroy()
-        run_login()
+    def match(self, face_encodings):
+        """
+        Devuelve tres arreglos alineados con face_encodings: índice del rostro
+        más cercano de la galería, distancia euclidiana a ese rostro y si la
+        distancia está dentro de la tolerancia.
+        """
+        with metrics.timer("matching"):
+            return self._match(face_encodings)
 
-    def _go_back_to_menu_docente(self):
-        self.master.destroy()
-        root = tk.Tk()
-        DocenteMenu(root, self.username)
-        root.mainloop()
+    def _match(self, face_encodings):
+        queries = np.asarray(face_encodings, dtype=np.float32).reshape(-1, 128)
+        n = len(queries)
+        if n == 0 or len(self.gallery) == 0:
+            return (np.full(n, -1, dtype=np.intp),
+                    np.full(n, np.inf, dtype=np.float32),
+                    np.zeros(n, dtype=bool))
 
-    def get_teacher_grade_section(self):
-        conn = sqlite3.connect("database/attendance.db")
-        cursor = conn.cursor()
-        cursor.execute("SELECT assigned_grade, assigned_section FROM users WHERE username=?", (self.username,))
-        result = cursor.fetchone()
-        conn.close()
-        if result:
-            return result[0], result[1]
-        else:
-            return "", ""
+        # ||q - g||^2 = ||q||^2 + ||g||^2 - 2 q.g, con un único producto matricial
+        d2 = queries @ self.gallery.T
+        d2 *= -2.0
+        d2 += self.gallery_sq_norms
+        d2 += np.einsum("ij,ij->i", queries, queries)[:, None]
 
-    def load_known_faces(self):
-        try:
-            self.known_face_encodings = []
-            self.known_face_names = []
-            
-            for filename in os.listdir(self.dataset_dir):
-                if filename.lower().endswith((".jpg", ".png")):
-                    path = os.path.join(self.dataset_dir, filename)
-                    try:
-                        image = face_recognition.load_image_file(path)
-                        encodings = face_recognition.face_encodings(image)
-                        
-                        if encodings:
-                            self.known_face_encodings.append(encodings[0])
-                            name = os.path.splitext(filename)[0]
-                            self.known_face_names.append(name)
-                        else:
-                            self.text.insert(tk.END, f"No se detectaron rostros en: {filename}\n")
-                    except Exception as e:
-                        self.text.insert(tk.END, f"Error procesando {filename}: {str(e)}\n")
-                        
-            self.text.insert(tk.END, f"Cargados {len(self.known_face_names)} rostros conocidos.\n")
-        except Exception as e:
-            self.text.insert(tk.END, f"Error al cargar rostros conocidos: {str(e)}\n")
+        best = np.argmin(d2, axis=1)
+        best_dist = np.sqrt(np.maximum(d2[np.arange(n), best], 0.0))
+        return best, best_dist, best_dist <= self.tolerance
 
-    def upload_file(self):
-        try:
-            file_path = filedialog.askopenfilename(filetypes=[("Archivos de imagen y video", "*.jpg *.png *.mp4 *.avi")])
-            if not file_path:
-                return
-                
-            ext = os.path.splitext(file_path)[1].lower()
-            if ext in [".jpg", ".png"]:
-                self.process_image(file_path)
-            elif ext in [".mp4", ".avi"]:
-                self.process_video(file_path)
-                self.recorded_video_path = file_path
-            else:
-                messagebox.showerror("Error", "Formato no soportado.")
-        except Exception as e:
-            self.text.insert(tk.END, f"Error al cargar archivo: {str(e)}\n")
+    def identify(self, face_encodings):
+        """Devuelve el nombre reconocido (o None) para cada codificación."""
+        indices, _, accepted = self.match(face_encodings)
+        return [self.names[i] if ok else None for i, ok in zip(indices, accepted)]
 
-    def process_image(self, image_path):
-        try:
-            self.text.insert(tk.END, f"Procesando imagen: {image_path}\n")
-            self.master.update()
-            
-            image = face_recognition.load_image_file(image_path)
-            face_locations = face_recognition.face_locations(image)
-            
-            if not face_locations:
-                self.text.insert(tk.END, "No se detectaron rostros en la imagen.\n")
-                return
-                
-            face_encodings = face_recognition.face_encodings(image, face_locations)
-            presentes = set()
-            
-            for face_encoding in face_encodings:
-                matches = face_recognition.compare_faces(self.known_face_encodings, face_encoding, tolerance=0.5)
-                face_distances = face_recognition.face_distance(self.known_face_encodings, face_encoding)
-                
-                if True in matches:  # Si hay al menos una coincidencia
-                    best_match_index = np.argmin(face_distances)
-                    if matches[best_match_index]:
-                        student_code = self.known_face_names[best_match_index]
-                        
-                        # Verificar si ya tiene asistencia hoy
-                        if not self.check_attendance_today(student_code):
-                            presentes.add(student_code)
-                        else:
-                            self.text.insert(tk.END, f"{student_code} ya tiene asistencia registrada hoy.\n")
+    def extended(self, names, encodings):
+        """Nuevo FaceMatcher con rostros agregados; el original no cambia (lo pueden estar usando)."""
+        if len(names) == 0:
+            return self
+        added = np.asarray(encodings, dtype=np.float32).reshape(-1, 128)
+        return FaceMatcher(self.names + list(names), np.concatenate([self.gallery, added]), self.tolerance)
 
-            if presentes:
-                self.register_attendance(presentes)
-                self.text.insert(tk.END, f"Asistencia registrada: {', '.join(presentes)}\n")
-            else:
-                self.text.insert(tk.END, "No se reconocieron rostros nuevos para registrar asistencia.\n")
-                
-        except Exception as e:
-            self.text.insert(tk.END, f"Error al procesar imagen: {str(e)}\n")
+# ------------------------------------------------------------
+# Galería compacta cuantizada (int8 o float16) en disco
+# ------------------------------------------------------------
+QUANTIZED_FORMATS = ("int8", "float16")
+QUANTIZED_RERANK_TOP_K = 16      # Candidatos de la búsqueda gruesa que se recalculan en float32
+QUANTIZED_CHUNK_ROWS = 2048      # Filas convertidas a float32 por vez (caben en la caché del procesador)
+GALLERY_STORE_FILES = ("codes", "scales", "sq_norms", "exact", "names")
+GALLERY_STORE_DIR = None         # Si se indica (--gallery-store), la galería completa se guarda y se lee ahí
+FINGERPRINT_CHUNK_ROWS = 8192
+
+def encoding_fingerprint(names, encodings):
+    """
+    Huella de un conjunto de pares (nombre, codificación) que no depende del
+    orden y se puede actualizar sumando la de los pares nuevos: así una galería o
+    un índice guardado sigue siendo válido después de add_student.
+    """
+    vectors = np.ascontiguousarray(np.asarray(encodings, dtype=np.float32).reshape(-1, 128))
+    weights = np.random.default_rng(0x1F5EED).integers(1, 2**63, size=128, dtype=np.uint64) | np.uint64(1)
+    total = 0
+    for start in range(0, len(vectors), FINGERPRINT_CHUNK_ROWS):
+        chunk = vectors[start:start + FINGERPRINT_CHUNK_ROWS].view(np.uint32).astype(np.uint64)
+        h = (chunk * weights).sum(axis=1, dtype=np.uint64)
+        h ^= np.array([int.from_bytes(hashlib.blake2b(str(name).encode(), digest_size=8).digest(), "little")
+                       for name in names[start:start + FINGERPRINT_CHUNK_ROWS]], dtype=np.uint64)
+        # Mezcla no lineal por fila (splitmix64) antes de sumar
+        h ^= h >> np.uint64(31)
+        h *= np.uint64(0xBF58476D1CE4E5B9)
+        h ^= h >> np.uint64(27)
+        total = (total + int(h.sum(dtype=np.uint64))) % 2**64
+    return total
+
+def save_array_folder(directory, arrays, meta):
+    """
+    Guarda varios arreglos en 'directory' como una sola versión: cada archivo
+    lleva la versión en el nombre y meta.json, que se reemplaza al final, dice
+    cuál es la vigente. Un guardado interrumpido deja la versión anterior
+    intacta y nunca se mezclan archivos de dos versiones.
+    """
+    os.makedirs(directory, exist_ok=True)
+    meta_path = os.path.join(directory, "meta.json")
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            previous = json.load(f).get("version")
+    except (OSError, ValueError):
+        previous = None
+
+    version = f"{time.time_ns():x}-{os.getpid()}"
+    for name, array in arrays.items():
+        with open(os.path.join(directory, f"{name}-{version}.npy"), "wb") as f:
+            np.save(f, np.ascontiguousarray(array), allow_pickle=False)
+            f.flush()
+            os.fsync(f.fileno())
+    with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(dict(meta, version=version, arrays=sorted(arrays)), f)
+    os.replace(meta_path + ".tmp", meta_path)
+
+    # La versión anterior ya no se abre; en Windows puede seguir mapeada y se borrará después
+    if previous is not None:
+        for name in arrays:
+            try:
+                os.remove(os.path.join(directory, f"{name}-{previous}.npy"))
+            except OSError:
+                pass
 
-    def process_video(self, video_path):
+def load_array_folder(directory, names, mmap=True):
+    """Devuelve (meta, {nombre: arreglo}) de la versión vigente; lanza OSError/ValueError si no hay una válida."""
+    for attempt in range(2):
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
         try:
-            self.text.insert(tk.END, "Procesando video...\n")
-            self.master.update()
-            
-            cap = cv2.VideoCapture(video_path)
-            if not cap.isOpened():
-                self.text.insert(tk.END, "Error al abrir el video.\n")
-                return
+            arrays = {name: np.load(os.path.join(directory, f"{name}-{meta['version']}.npy"),
+                                    mmap_mode="r" if mmap else None, allow_pickle=False)
+                      for name in names}
+        except FileNotFoundError:
+            # Otro proceso publicó una versión nueva mientras se abría esta
+            if attempt:
+                raise
+            continue
+        except KeyError as e:
+            raise ValueError(f"meta.json incompleto: {e}")
+        return meta, arrays
 
-            presentes = set()
-            frame_count = 0
-            process_every_n_frames = 5  # Procesar 1 de cada 5 frames para mejorar rendimiento
+class QuantizedFaceMatcher:
+    """
+    Galería para escuelas grandes o todo un distrito: las codificaciones se
+    guardan cuantizadas (int8 con una escala por dimensión, 128 bytes por
+    rostro, o float16, 256 bytes) en una matriz contigua, con los nombres en un
+    arreglo paralelo. La búsqueda gruesa recorre solo la matriz cuantizada y
+    los top_k candidatos de cada rostro se recalculan con las codificaciones
+    float32 exactas, así la tolerancia se aplica sobre la distancia real.
 
-            while True:
-                ret, frame = cap.read()
-                if not ret:
-                    break
+    save()/load() usan archivos .npy en una carpeta (ver save_array_folder);
+    load() los abre con memoria mapeada, de modo que las codificaciones
+    exactas solo se leen del disco para los candidatos. meta.json guarda la
+    huella de los rostros (encoding_fingerprint) para saber si la galería
+    guardada sigue correspondiendo a students. Misma interfaz que FaceMatcher.
+    """
+    def __init__(self, names, codes, scales, sq_norms, exact, tolerance=MATCH_TOLERANCE,
+                 top_k=QUANTIZED_RERANK_TOP_K, fingerprint=0):
+        self.names = names
+        self.codes = codes
+        self.scales = scales
+        self.sq_norms = sq_norms
+        self.exact = exact
+        self.tolerance = tolerance
+        self.top_k = top_k
+        self.fingerprint = fingerprint
+        self.directory = None  # Carpeta donde se guarda, si la galería es persistente
 
-                frame_count += 1
-                if frame_count % process_every_n_frames != 0:
-                    continue
+    @property
+    def format(self):
+        return "int8" if self.codes.dtype == np.int8 else "float16"
 
-                try:
-                    rgb_frame = frame[:, :, ::-1]
-                    face_locations = face_recognition.face_locations(rgb_frame)
-                    
-                    if not face_locations:
-                        continue
-                        
-                    face_encodings = face_recognition.face_encodings(rgb_frame, face_locations)
-                    
-                    for face_encoding in face_encodings:
-                        matches = face_recognition.compare_faces(self.known_face_encodings, face_encoding, tolerance=0.5)
-                        face_distances = face_recognition.face_distance(self.known_face_encodings, face_encoding)
-                        
-                        if True in matches:
-                            best_match_index = np.argmin(face_distances)
-                            if matches[best_match_index]:
-                                student_code = self.known_face_names[best_match_index]
-                                
-                                # Verificar si ya tiene asistencia hoy
-                                if not self.check_attendance_today(student_code):
-                                    presentes.add(student_code)
-                                else:
-                                    self.text.insert(tk.END, f"{student_code} ya tiene asistencia registrada hoy.\n")
-                except Exception as e:
-                    continue
+    @staticmethod
+    def quantize(encodings, fmt="int8", scales=None):
+        """Devuelve (códigos, escalas, normas al cuadrado de los vectores reconstruidos)."""
+        if fmt not in QUANTIZED_FORMATS:
+            raise ValueError(f"Formato de galería desconocido: {fmt}")
+        vectors = np.asarray(encodings, dtype=np.float32).reshape(-1, 128)
+        if fmt == "float16":
+            scales = np.ones(128, dtype=np.float32)
+            codes = vectors.astype(np.float16)
+        else:
+            if scales is None:
+                scales = np.abs(vectors).max(axis=0) / 127.0 if len(vectors) else np.ones(128, dtype=np.float32)
+                scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+            codes = np.clip(np.rint(vectors / scales), -127, 127).astype(np.int8)
+        restored = codes.astype(np.float32) * scales
+        return codes, scales, np.einsum("ij,ij->i", restored, restored)
 
-            cap.release()
+    @classmethod
+    def build(cls, names, encodings, fmt="int8", tolerance=MATCH_TOLERANCE, top_k=QUANTIZED_RERANK_TOP_K,
+              fingerprint=None):
+        names = list(names)
+        exact = np.ascontiguousarray(np.asarray(encodings, dtype=np.float32).reshape(-1, 128))
+        codes, scales, sq_norms = cls.quantize(exact, fmt)
+        if fingerprint is None:
+            fingerprint = encoding_fingerprint(names, exact)
+        return cls(np.asarray(names, dtype=str), codes, scales, sq_norms, exact, tolerance, top_k, fingerprint)
 
-            if presentes:
-                self.register_attendance(presentes)
-                self.text.insert(tk.END, f"Rostros detectados: {', '.join(presentes)}\n")
-            else:
-                self.text.insert(tk.END, "No se reconocieron rostros nuevos para registrar asistencia.\n")
-                
-        except Exception as e:
-            self.text.insert(tk.END, f"Error al procesar video: {str(e)}\n")
-            if 'cap' in locals() and cap.isOpened():
-                cap.release()
+    def save(self, directory):
+        """Escribe la galería en 'directory' como una versión nueva (ver save_array_folder)."""
+        arrays = (self.codes, self.scales, self.sq_norms, self.exact, self.names)
+        save_array_folder(directory, dict(zip(GALLERY_STORE_FILES, arrays)),
+                          {"size": len(self.names), "format": self.format, "fingerprint": str(self.fingerprint)})
 
-    def check_attendance_today(self, student_code):
-        """Verifica si el estudiante ya tiene asistencia registrada hoy"""
-        today = datetime.now().strftime("%Y-%m-%d")
-        conn = sqlite3.connect("database/attendance.db")
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT 1 FROM attendance 
-            WHERE student_code = ? 
-            AND date(timestamp) = ?
-            LIMIT 1
-        """, (student_code, today))
-        result = cursor.fetchone()
-        conn.close()
-        return result is not None
+    @classmethod
+    def load(cls, directory, mmap=True, tolerance=MATCH_TOLERANCE, top_k=QUANTIZED_RERANK_TOP_K):
+        meta, arrays = load_array_folder(directory, GALLERY_STORE_FILES, mmap)
+        codes, scales, sq_norms, exact, names = (arrays[name] for name in GALLERY_STORE_FILES)
+        if not (len(names) == len(codes) == len(sq_norms) == len(exact) == meta["size"]):
+            raise ValueError("Galería guardada incompleta")
+        store = cls(names, codes, np.asarray(scales), np.asarray(sq_norms), exact, tolerance, top_k,
+                    int(meta["fingerprint"]))
+        store.directory = directory
+        return store
 
-    def take_photo(self):
-        cap = None
+    @classmethod
+    def open_or_build(cls, directory, names, encodings, fmt=None):
+        """
+        Abre la galería guardada si corresponde a estos rostros; si no (alumnos
+        matriculados o fotos cambiadas después de guardarla), la vuelve a
+        generar con el mismo formato y la guarda.
+        """
+        vectors = np.asarray(encodings, dtype=np.float32).reshape(-1, 128)
+        fingerprint = encoding_fingerprint(names, vectors)
         try:
-            cap = cv2.VideoCapture(0)
-            if not cap.isOpened():
-                self.text.insert(tk.END, "Error: No se pudo abrir la cámara.\n")
-                return
+            store = cls.load(directory)
+            if store.fingerprint == fingerprint and len(store) == len(vectors):
+                return store
+            fmt = fmt or store.format
+        except (OSError, ValueError, KeyError):
+            pass
+        store = cls.build(names, vectors, fmt or "int8", fingerprint=fingerprint)
+        store.save(directory)
+        store.directory = directory
+        return store
 
-            self.text.insert(tk.END, "Grabando video... Presiona 'q' para detener.\n")
-            self.master.update()
+    def __len__(self):
+        return len(self.names)
 
-            while True:
-                ret, frame = cap.read()
-                if not ret:
-                    self.text.insert(tk.END, "Error al capturar frame de la cámara.\n")
-                    break
+    def nbytes(self):
+        """Bytes de cada parte: la búsqueda gruesa recorre 'coarse'; de 'exact' solo se leen los candidatos."""
+        return {"coarse": self.codes.nbytes + self.sq_norms.nbytes + self.scales.nbytes,
+                "exact": self.exact.nbytes,
+                "names": self.names.nbytes}
 
-                cv2.imshow("Tomar Foto - Presiona 'q' para salir", frame)
-                key = cv2.waitKey(1) & 0xFF
-                
-                if key == ord('q'):
-                    self.text.insert(tk.END, "Grabación finalizada por el usuario.\n")
-                    break
-                    
-                # Tomar foto cuando se presiona 's'
-                if key == ord('s'):
-                    temp_img_path = "temp_photo.jpg"
-                    cv2.imwrite(temp_img_path, frame)
-                    
-                    # Procesar la imagen capturada
-                    try:
-                        image = face_recognition.load_image_file(temp_img_path)
-                        face_locations = face_recognition.face_locations(image)
-                        
-                        if not face_locations:
-                            self.text.insert(tk.END, "No se detectaron rostros en la foto.\n")
-                            continue
-                            
-                        face_encodings = face_recognition.face_encodings(image, face_locations)
-                        presentes = set()
-                        
-                        for face_encoding in face_encodings:
-                            matches = face_recognition.compare_faces(self.known_face_encodings, face_encoding, tolerance=0.5)
-                            face_distances = face_recognition.face_distance(self.known_face_encodings, face_encoding)
-                            
-                            if True in matches:
-                                best_match_index = np.argmin(face_distances)
-                                if matches[best_match_index]:
-                                    student_code = self.known_face_names[best_match_index]
-                                    
-                                    # Verificar si ya tiene asistencia hoy
-                                    if not self.check_attendance_today(student_code):
-                                        presentes.add(student_code)
-                                    else:
-                                        self.text.insert(tk.END, f"{student_code} ya tiene asistencia registrada hoy.\n")
-
-                        if presentes:
-                            self.register_attendance(presentes)
-                            self.text.insert(tk.END, f"Rostros detectados: {', '.join(presentes)}\n")
-                        else:
-                            self.text.insert(tk.END, "No se reconocieron rostros nuevos para registrar asistencia.\n")
-                            
-                    except Exception as e:
-                        self.text.insert(tk.END, f"Error al procesar foto: {str(e)}\n")
+    def match(self, face_encodings):
+        """Igual que FaceMatcher.match: (índice, distancia exacta, aceptado) por codificación."""
+        with metrics.timer("matching"):
+            return self._match(face_encodings)
 
-        except Exception as e:
-            self.text.insert(tk.END, f"Error en la captura de foto: {str(e)}\n")
-        finally:
-            if cap is not None and cap.isOpened():
-                cap.release()
+    def _coarse_candidates(self, queries):
+        """Índices (n x k) de los k rostros más cercanos según la galería cuantizada."""
+        n, total = len(queries), len(self.codes)
+        k = min(self.top_k, total)
+        # q.g ~ (q * escala) . códigos; ||q||^2 no cambia el orden y se omite
+        scaled = queries * self.scales
+        d2 = np.empty((n, total), dtype=np.float32)
+        for start in range(0, total, QUANTIZED_CHUNK_ROWS):
+            chunk = self.codes[start:start + QUANTIZED_CHUNK_ROWS].astype(np.float32)
+            np.matmul(scaled, chunk.T, out=d2[:, start:start + len(chunk)])
+        d2 *= -2.0
+        d2 += self.sq_norms
+        if k == total:
+            return np.broadcast_to(np.arange(total), (n, total))
+        return np.argpartition(d2, k - 1, axis=1)[:, :k]
+
+    def _match(self, face_encodings):
+        queries = np.asarray(face_encodings, dtype=np.float32).reshape(-1, 128)
+        n = len(queries)
+        if n == 0 or len(self.codes) == 0:
+            return (np.full(n, -1, dtype=np.intp),
+                    np.full(n, np.inf, dtype=np.float32),
+                    np.zeros(n, dtype=bool))
+
+        candidates = self._coarse_candidates(queries)
+        # Re-ranking exacto: solo se leen las filas float32 de los candidatos
+        rows = np.unique(candidates)
+        exact = np.asarray(self.exact[rows], dtype=np.float32)
+        positions = np.searchsorted(rows, candidates)
+        diff = exact[positions] - queries[:, None, :]
+        dist = np.sqrt(np.einsum("ijk,ijk->ij", diff, diff))
+
+        pick = np.argmin(dist, axis=1)
+        best = candidates[np.arange(n), pick].astype(np.intp)
+        best_dist = dist[np.arange(n), pick]
+        return best, best_dist, best_dist <= self.tolerance
+
+    def identify(self, face_encodings):
+        """Devuelve el nombre reconocido (o None) para cada codificación."""
+        indices, _, accepted = self.match(face_encodings)
+        return [str(self.names[i]) if ok else None for i, ok in zip(indices, accepted)]
+
+    def extended(self, names, encodings):
+        """
+        Nueva galería en memoria con rostros agregados (cuantizados con las
+        escalas actuales); si esta se guardaba en disco, la nueva también
+        (add_student la guarda en segundo plano con save_search_index_later).
+        """
+        if len(names) == 0:
+            return self
+        names = list(names)
+        added = np.asarray(encodings, dtype=np.float32).reshape(-1, 128)
+        codes, _, sq_norms = self.quantize(added, self.format, self.scales)
+        extended = QuantizedFaceMatcher(np.concatenate([self.names, np.asarray(names, dtype=str)]),
+                                        np.concatenate([self.codes, codes]), self.scales,
+                                        np.concatenate([self.sq_norms, sq_norms]),
+                                        np.concatenate([self.exact, added]), self.tolerance, self.top_k,
+                                        (self.fingerprint + encoding_fingerprint(names, added)) % 2**64)
+        extended.directory = self.directory
+        return extended
+
+# ------------------------------------------------------------
+# Índice aproximado (IVF) para galerías grandes
+# ------------------------------------------------------------
+SEARCH_BACKENDS = ("auto", "exact", "ivf")
+SEARCH_BACKEND = "auto"           # --search-backend; "auto" usa IVF desde SEARCH_INDEX_MIN_SIZE rostros
+SEARCH_INDEX_MIN_SIZE = 20_000
+IVF_N_PROBE = 12                  # Listas revisadas por rostro
+IVF_KMEANS_ITERATIONS = 10
+IVF_TRAIN_POINTS_PER_LIST = 64    # Muestra para entrenar k-means (no hace falta toda la galería)
+IVF_CHUNK_ROWS = 8192
+IVF_INDEX_FILES = ("centroids", "vectors", "ids", "offsets", "names")
+
+def _nearest_centroid(vectors, centroids):
+    centroid_sq_norms = np.einsum("ij,ij->i", centroids, centroids)
+    assignment = np.empty(len(vectors), dtype=np.intp)
+    for start in range(0, len(vectors), IVF_CHUNK_ROWS):
+        d2 = vectors[start:start + IVF_CHUNK_ROWS] @ centroids.T
+        d2 *= -2.0
+        d2 += centroid_sq_norms
+        assignment[start:start + len(d2)] = np.argmin(d2, axis=1)
+    return assignment
+
+def train_kmeans(vectors, n_lists, iterations=IVF_KMEANS_ITERATIONS, seed=0):
+    """k-means de Lloyd sobre una muestra; las listas vacías se reinician con puntos al azar."""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), n_lists * IVF_TRAIN_POINTS_PER_LIST)
+    sample = np.asarray(vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))], dtype=np.float32)
+    centroids = sample[rng.choice(sample_size, n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = _nearest_centroid(sample, centroids)
+        order = np.argsort(assignment, kind="stable")
+        counts = np.bincount(assignment, minlength=n_lists)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        filled = counts > 0
+        sums = np.add.reduceat(sample[order], starts[filled], axis=0)
+        centroids[filled] = sums / counts[filled, None]
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = sample[rng.choice(sample_size, len(empty), replace=False)]
+    return centroids
+
+class IVFFaceMatcher:
+    """
+    Índice de archivo invertido: k-means reparte la galería en ~sqrt(N)
+    listas y cada rostro se compara solo con las IVF_N_PROBE listas de
+    centroides más cercanos, con distancias exactas float32. Es aproximado
+    (un alumno en una lista no revisada no se encuentra); bench_search_index.py
+    mide cuánto recall se pierde. Misma interfaz que FaceMatcher.
+
+    Las listas son arreglos independientes: extended() ubica los rostros
+    nuevos en su centroide más cercano y copia solo las listas que cambian,
+    sin volver a entrenar (salvo que la galería se haya duplicado desde el
+    último entrenamiento). save()/load() guardan el índice en una carpeta.
+    """
+    def __init__(self, names, centroids, lists, tolerance=MATCH_TOLERANCE, n_probe=IVF_N_PROBE,
+                 trained_size=0, fingerprint=0):
+        self.names = names
+        self.centroids = centroids
+        self.centroid_sq_norms = np.einsum("ij,ij->i", centroids, centroids)
+        self.lists = lists  # Por centroide: (índices en names, codificaciones float32)
+        # k-means puede dejar centroides sin rostros: nunca se eligen para revisar
+        self._empty_lists = np.array([len(ids) == 0 for ids, _ in lists], dtype=bool)
+        self.tolerance = tolerance
+        self.n_probe = n_probe
+        self.trained_size = trained_size
+        self.fingerprint = fingerprint
+        self.directory = None  # Carpeta donde se guarda, si el índice es persistente
+
+    @classmethod
+    def build(cls, names, encodings, n_lists=None, tolerance=MATCH_TOLERANCE, n_probe=IVF_N_PROBE, fingerprint=None):
+        names = list(names)
+        vectors = np.ascontiguousarray(np.asarray(encodings, dtype=np.float32).reshape(-1, 128))
+        n_lists = n_lists or max(1, int(round(np.sqrt(len(vectors)))))
+        n_lists = min(n_lists, len(vectors)) or 1
+        centroids = train_kmeans(vectors, n_lists) if len(vectors) else np.zeros((1, 128), dtype=np.float32)
+        assignment = _nearest_centroid(vectors, centroids)
+        order = np.argsort(assignment, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=len(centroids)))])
+        if fingerprint is None:
+            fingerprint = encoding_fingerprint(names, vectors)
+        return cls(names, centroids, cls._split_lists(order, vectors[order], offsets), tolerance, n_probe,
+                   trained_size=len(vectors), fingerprint=fingerprint)
+
+    @staticmethod
+    def _split_lists(ids, vectors, offsets):
+        return [(ids[a:b], vectors[a:b]) for a, b in zip(offsets[:-1], offsets[1:])]
+
+    def __len__(self):
+        return len(self.names)
+
+    def match(self, face_encodings):
+        """Igual que FaceMatcher.match, pero solo sobre las listas revisadas."""
+        with metrics.timer("matching"):
+            return self._match(face_encodings)
+
+    def _match(self, face_encodings):
+        queries = np.asarray(face_encodings, dtype=np.float32).reshape(-1, 128)
+        n = len(queries)
+        if n == 0 or len(self.names) == 0:
+            return (np.full(n, -1, dtype=np.intp),
+                    np.full(n, np.inf, dtype=np.float32),
+                    np.zeros(n, dtype=bool))
+
+        d2 = queries @ self.centroids.T
+        d2 *= -2.0
+        d2 += self.centroid_sq_norms
+        d2[:, self._empty_lists] = np.inf
+        n_probe = min(self.n_probe, len(self.centroids))
+        probed = np.argpartition(d2, n_probe - 1, axis=1)[:, :n_probe] if n_probe < len(self.centroids) else None
+        # Una sola comparación sobre la unión de las listas revisadas por los rostros del frame
+        lists = [self.lists[i] for i in (np.unique(probed) if probed is not None else range(len(self.lists)))]
+        lists = [item for item in lists if len(item[0])]
+        ids = np.concatenate([item[0] for item in lists])
+        candidates = np.concatenate([item[1] for item in lists])
+
+        d2 = queries @ candidates.T
+        d2 *= -2.0
+        d2 += np.einsum("ij,ij->i", candidates, candidates)
+        d2 += np.einsum("ij,ij->i", queries, queries)[:, None]
+        pick = np.argmin(d2, axis=1)
+        best = ids[pick].astype(np.intp)
+        best_dist = np.sqrt(np.maximum(d2[np.arange(n), pick], 0.0))
+        return best, best_dist, best_dist <= self.tolerance
+
+    def identify(self, face_encodings):
+        """Devuelve el nombre reconocido (o None) para cada codificación."""
+        indices, _, accepted = self.match(face_encodings)
+        return [self.names[i] if ok else None for i, ok in zip(indices, accepted)]
+
+    def extended(self, names, encodings):
+        """Nuevo índice con rostros agregados en sus listas; el original no cambia."""
+        if len(names) == 0:
+            return self
+        names = list(names)
+        added = np.asarray(encodings, dtype=np.float32).reshape(-1, 128)
+        fingerprint = (self.fingerprint + encoding_fingerprint(names, added)) % 2**64
+        all_names = self.names + names
+        if len(all_names) > 2 * self.trained_size:
+            vectors = np.empty((len(all_names), 128), dtype=np.float32)
+            for ids, list_vectors in self.lists:
+                vectors[ids] = list_vectors
+            vectors[len(self.names):] = added
+            extended = IVFFaceMatcher.build(all_names, vectors, tolerance=self.tolerance, n_probe=self.n_probe,
+                                            fingerprint=fingerprint)
+        else:
+            lists = list(self.lists)
+            new_ids = np.arange(len(self.names), len(all_names))
+            assignment = _nearest_centroid(added, self.centroids)
+            for c in np.unique(assignment):
+                ids, list_vectors = lists[c]
+                lists[c] = (np.concatenate([ids, new_ids[assignment == c]]),
+                            np.concatenate([list_vectors, added[assignment == c]]))
+            extended = IVFFaceMatcher(all_names, self.centroids, lists, self.tolerance, self.n_probe,
+                                      self.trained_size, fingerprint)
+        extended.directory = self.directory
+        return extended
+
+    def save(self, directory):
+        """Escribe el índice en 'directory' (listas contiguas con desplazamientos, ver save_array_folder)."""
+        sizes = [len(ids) for ids, _ in self.lists]
+        arrays = (self.centroids,
+                  np.concatenate([vectors for _, vectors in self.lists]),
+                  np.concatenate([ids for ids, _ in self.lists]).astype(np.int64),
+                  np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64),
+                  np.asarray(self.names, dtype=str))
+        save_array_folder(directory, dict(zip(IVF_INDEX_FILES, arrays)),
+                          {"size": len(self.names), "trained_size": self.trained_size,
+                           "fingerprint": str(self.fingerprint)})
+
+    @classmethod
+    def load(cls, directory, tolerance=MATCH_TOLERANCE, n_probe=IVF_N_PROBE):
+        meta, arrays = load_array_folder(directory, IVF_INDEX_FILES)
+        centroids, vectors, ids, offsets, names = (arrays[name] for name in IVF_INDEX_FILES)
+        if not (len(names) == len(vectors) == len(ids) == meta["size"] and len(offsets) == len(centroids) + 1
+                and offsets[-1] == len(vectors)):
+            raise ValueError("Índice incompleto")
+        index = cls([str(name) for name in names], np.asarray(centroids),
+                    cls._split_lists(np.asarray(ids, dtype=np.intp), vectors, offsets),
+                    tolerance, n_probe, meta["trained_size"], int(meta["fingerprint"]))
+        index.directory = directory
+        return index
+
+    @classmethod
+    def open_or_build(cls, directory, names, encodings):
+        """Abre el índice guardado si corresponde a estos rostros; si no, lo entrena y lo guarda."""
+        vectors = np.asarray(encodings, dtype=np.float32).reshape(-1, 128)
+        fingerprint = encoding_fingerprint(names, vectors)
+        try:
+            index = cls.load(directory)
+            if index.fingerprint == fingerprint and len(index) == len(vectors):
+                return index
+        except (OSError, ValueError, KeyError):
+            pass
+        index = cls.build(names, vectors, fingerprint=fingerprint)
+        index.save(directory)
+        index.directory = directory
+        return index
+
+_search_index_saver = ThreadPoolExecutor(max_workers=1, thread_name_prefix="search-index")
+
+def make_matcher(names, encodings, index_dir=None, backend=None):
+    """
+    Elige el buscador de rostros: FaceMatcher (comparación exacta con toda la
+    galería, la referencia) o IVFFaceMatcher. Con backend "auto" se usa IVF
+    desde SEARCH_INDEX_MIN_SIZE rostros; con index_dir el índice se guarda y
+    se reutiliza entre ejecuciones.
+    """
+    backend = backend or SEARCH_BACKEND
+    if backend == "exact" or (backend == "auto" and len(names) < SEARCH_INDEX_MIN_SIZE) or len(names) == 0:
+        return FaceMatcher(names, encodings)
+    if index_dir is None:
+        return IVFFaceMatcher.build(names, encodings)
+    return IVFFaceMatcher.open_or_build(index_dir, names, encodings)
+
+def _report_failed_save(future):
+    if future.exception() is not None:
+        # Disco lleno, carpeta sin permisos...: el índice se regenera en el próximo inicio
+        logger.error("No se pudo guardar el índice de rostros", exc_info=future.exception())
+
+def save_search_index_later(matcher):
+    """Guarda en segundo plano (y en orden) un índice persistente modificado por add_student."""
+    if getattr(matcher, "directory", None):
+        future = _search_index_saver.submit(matcher.save, matcher.directory)
+        future.add_done_callback(_report_failed_save)
+
+# ------------------------------------------------------------
+# Codificaciones de alumnos guardadas en students.dataset
+# ------------------------------------------------------------
+ENCODING_BLOB_MAGIC = b"ENC1"
+MIN_ENROLLMENT_FACE_SIZE = 80  # Lado mínimo del rostro en píxeles
+
+def encodings_to_blob(encodings):
+    """Serializa una o más codificaciones de 128 valores para students.dataset."""
+    vectors = np.asarray(encodings, dtype="<f4").reshape(-1, 128)
+    return ENCODING_BLOB_MAGIC + vectors.tobytes()
+
+def blob_to_encodings(blob):
+    """
+    Devuelve la matriz (k x 128) guardada en students.dataset, o None si la
+    columna está vacía o todavía contiene una imagen (registros antiguos).
+    """
+    if not blob or not bytes(blob[:4]) == ENCODING_BLOB_MAGIC:
+        return None
+    data = bytes(blob[4:])
+    if len(data) == 0 or len(data) % (128 * 4) != 0:
+        return None
+    return np.frombuffer(data, dtype="<f4").reshape(-1, 128)
+
+def is_image_blob(blob):
+    return isinstance(blob, bytes) and blob.startswith((b"\x89PNG", b"\xff\xd8\xff"))
+
+def encode_enrollment_photo(image_bytes):
+    """
+    Detecta y codifica el rostro de una foto de matrícula. Exige exactamente un
+    rostro de al menos MIN_ENROLLMENT_FACE_SIZE píxeles; si no, lanza ValueError.
+    """
+    image = face_recognition.load_image_file(io.BytesIO(image_bytes))
+    face_locations = face_recognition.face_locations(image)
+    if not face_locations:
+        raise ValueError("No se detectó ningún rostro en la foto.")
+    if len(face_locations) > 1:
+        raise ValueError(f"Se detectaron {len(face_locations)} rostros; la foto debe tener solo uno.")
+
+    top, right, bottom, left = face_locations[0]
+    if min(bottom - top, right - left) < MIN_ENROLLMENT_FACE_SIZE:
+        raise ValueError(f"El rostro es demasiado pequeño (mínimo {MIN_ENROLLMENT_FACE_SIZE} píxeles).")
+
+    encodings = face_recognition.face_encodings(image, face_locations)
+    return np.asarray(encodings, dtype=np.float32)
+
+def _backfill_job(job):
+    """Trabajo de un proceso del backfill: (código, imagen) -> (código, blob, error)."""
+    code, image_bytes = job
+    try:
+        return code, encodings_to_blob(encode_enrollment_photo(image_bytes)), None
+    except Exception as e:
+        return code, None, str(e)
+
+def _find_enrollment_image(code, dataset_blob, photo, dataset_dir):
+    """Busca la imagen de un alumno antiguo: BLOB en dataset/photo, ruta en photo o dataset/."""
+    if is_image_blob(dataset_blob):
+        return dataset_blob
+    if is_image_blob(photo):
+        return photo
+
+    candidates = []
+    if isinstance(photo, str) and photo:
+        # Las rutas guardadas por versiones anteriores usan separadores de Windows
+        candidates.append(os.path.join(os.path.dirname(dataset_dir), *photo.replace("\\", "/").split("/")))
+    candidates += [os.path.join(dataset_dir, f"{code}{ext}") for ext in (".png", ".jpg")]
+    for path in candidates:
+        if os.path.isfile(path):
+            with open(path, "rb") as f:
+                return f.read()
+    return None
+
+def backfill_student_encodings(dataset_dir, workers=None):
+    """
+    Migración única: codifica en paralelo las fotos de los alumnos que aún no
+    tienen codificación en students.dataset (BLOB en photo/dataset o archivo en
+    dataset/). Solo se reemplaza dataset; photo no se toca, salvo que esté
+    vacía y la imagen viniera de la columna dataset: entonces se guarda ahí
+    para no perderla.
+    """
+    rows = db.fetchall("SELECT student_code, dataset, photo FROM students")
+
+    jobs = []
+    keep_photo = {}
+    missing = []
+    for code, dataset_blob, photo in rows:
+        if blob_to_encodings(dataset_blob) is not None:
+            continue
+        image_bytes = _find_enrollment_image(code, dataset_blob, photo, dataset_dir)
+        if image_bytes is None:
+            missing.append(code)
+            continue
+        jobs.append((code, image_bytes))
+        # None: photo queda como está (imagen o ruta de versiones anteriores)
+        keep_photo[code] = image_bytes if is_image_blob(dataset_blob) and not photo else None
+
+    updates, failed = [], []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for code, blob, error in pool.map(_backfill_job, jobs):
+            if blob is None:
+                failed.append((code, error))
+            else:
+                updates.append((blob, keep_photo[code], code))
+    with db.transaction():
+        db.executemany("UPDATE students SET dataset = ?, photo = COALESCE(?, photo) WHERE student_code = ?",
+                       updates)
+    updated = len(updates)
+    return updated, failed, missing
+
+# ------------------------------------------------------------
+# Galería particionada por grado/sección
+# ------------------------------------------------------------
+class FaceGallery:
+    """
+    Galería de rostros conocidos particionada por grado y sección. Cada partición
+    se carga la primera vez que se usa con una sola consulta a students.dataset,
+    sin decodificar imágenes. Los alumnos antiguos que aún no tienen codificación
+    guardada se completan con las imágenes de dataset/ (ver FaceEncodingCache).
+    Las particiones grandes usan un índice IVF (ver make_matcher), que con
+    index_dir se guarda en disco, una carpeta por partición.
+    """
+    def __init__(self, dataset_names=(), dataset_encodings=(), index_dir=None):
+        self.dataset_encodings = {}
+        for name, encoding in zip(dataset_names, dataset_encodings):
+            self.dataset_encodings.setdefault(name, []).append(encoding)
+        self.index_dir = index_dir
+        self._full_matcher = None
+        self._matchers = {}
+        self._lock = threading.Lock()
+
+    def _index_path(self, key):
+        if self.index_dir is None:
+            return None
+        name = "full" if key is None else "_".join(key)
+        return os.path.join(self.index_dir, "".join(c if c.isalnum() else "_" for c in name))
+
+    def _collect(self, rows, include_unregistered=False):
+        """(nombres, codificaciones) de las filas de students, completadas con dataset/."""
+        names, encodings = [], []
+        registered = set()
+        for code, blob in rows:
+            registered.add(code)
+            vectors = blob_to_encodings(blob)
+            if vectors is None:
+                vectors = self.dataset_encodings.get(code, [])
+            for vector in vectors:
+                names.append(code)
+                encodings.append(vector)
+        if include_unregistered:
+            # Imágenes de dataset/ que no corresponden a ningún alumno registrado
+            for code, vectors in self.dataset_encodings.items():
+                if code not in registered:
+                    names.extend([code] * len(vectors))
+                    encodings.extend(vectors)
+        return names, encodings
+
+    def _build_matcher(self, rows, include_unregistered=False, key=None):
+        names, encodings = self._collect(rows, include_unregistered)
+        return make_matcher(names, encodings, index_dir=self._index_path(key))
+
+    def full_matcher(self):
+        """
+        Galería completa. Con GALLERY_STORE_DIR se usa la galería cuantizada
+        guardada ahí si su huella coincide con students y dataset/; si quedó
+        desactualizada se vuelve a generar (students sigue siendo la fuente).
+        """
+        with self._lock:
+            if self._full_matcher is None:
+                rows = db.fetchall("SELECT student_code, dataset FROM students")
+                if GALLERY_STORE_DIR:
+                    names, encodings = self._collect(rows, include_unregistered=True)
+                    self._full_matcher = QuantizedFaceMatcher.open_or_build(GALLERY_STORE_DIR, names, encodings)
+                else:
+                    self._full_matcher = self._build_matcher(rows, include_unregistered=True)
+            return self._full_matcher
+
+    def matcher_for(self, grade, section):
+        """FaceMatcher de la partición; sin grado/sección se usa la galería completa."""
+        if not (grade and section):
+            return self.full_matcher()
+        with self._lock:
+            matcher = self._matchers.get((grade, section))
+            if matcher is None:
+                rows = db.fetchall("SELECT student_code, dataset FROM students WHERE grade=? AND section=?",
+                                   (grade, section))
+                matcher = self._build_matcher(rows, key=(grade, section))
+                self._matchers[(grade, section)] = matcher
+            return matcher
+
+    def preload_like(self, other):
+        """Carga las mismas particiones que ya tenía 'other', para reemplazarla sin demoras."""
+        for grade, section in list(other._matchers):
+            self.matcher_for(grade, section)
+        if other._full_matcher is not None:
+            self.full_matcher()
+
+    def add_student(self, code, grade, section, encodings):
+        """
+        Agrega un alumno recién matriculado a las particiones ya cargadas sin
+        volver a leerlas. Los FaceMatcher se reemplazan por copias extendidas,
+        así los reconocimientos en curso siguen con la versión anterior.
+        Las particiones aún no cargadas lo leerán de students.dataset; los
+        índices IVF guardados se actualizan en disco en segundo plano.
+        """
+        with self._lock:
+            key = (grade, section)
+            if key in self._matchers:
+                self._matchers[key] = self._matchers[key].extended([code] * len(encodings), encodings)
+                save_search_index_later(self._matchers[key])
+            if self._full_matcher is not None:
+                self._full_matcher = self._full_matcher.extended([code] * len(encodings), encodings)
+                save_search_index_later(self._full_matcher)
+
+    def identify(self, face_encodings, grade, section, fallback=False):
+        """
+        Reconoce los rostros en la partición de (grado, sección). Con fallback=True
+        los rostros no reconocidos se buscan además en la galería completa.
+        """
+        matcher = self.matcher_for(grade, section)
+        names = matcher.identify(face_encodings)
+        if fallback and matcher is not self._full_matcher:
+            pending = [i for i, name in enumerate(names) if name is None]
+            if pending:
+                retry = self.full_matcher().identify([face_encodings[i] for i in pending])
+                for i, name in zip(pending, retry):
+                    names[i] = name
+        return names
+
+def build_gallery_store(directory, dataset_names=(), dataset_encodings=(), fmt="int8"):
+    """
+    Guarda la galería completa (students.dataset más dataset/) como
+    QuantizedFaceMatcher en 'directory'. No hace falta repetirlo: con
+    --gallery-store la galería se regenera sola si students cambió y
+    add_student la actualiza en disco.
+    """
+    rows = db.fetchall("SELECT student_code, dataset FROM students")
+    names, encodings = FaceGallery(dataset_names, dataset_encodings)._collect(rows, include_unregistered=True)
+    store = QuantizedFaceMatcher.build(names, encodings, fmt)
+    store.save(directory)
+    return store
+
+# ------------------------------------------------------------
+# Vigilancia de dataset/ (fotos agregadas, cambiadas o eliminadas)
+# ------------------------------------------------------------
+DATASET_WATCH_DEBOUNCE_SECONDS = 1.0  # Espera tras el último cambio (copias de varios archivos)
+DATASET_POLL_INTERVAL_SECONDS = 2.0   # Intervalo del modo por sondeo
+DATASET_IMAGE_EXTENSIONS = (".jpg", ".png")
+
+class _Inotify:
+    """Envoltura mínima de inotify (Linux) con ctypes; solo informa si hubo cambios."""
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_DELETE = 0x00000200
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+    def __init__(self, path):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        mask = self.IN_CLOSE_WRITE | self.IN_MOVED_FROM | self.IN_MOVED_TO | self.IN_DELETE
+        if libc.inotify_add_watch(self.fd, os.fsencode(path), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, "inotify_add_watch")
+
+    def wait(self, timeout):
+        """Espera hasta timeout segundos; devuelve los nombres de archivo que cambiaron."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        names = []
+        offset = 0
+        while offset + self.EVENT_HEADER.size <= len(data):
+            _, _, _, length = self.EVENT_HEADER.unpack_from(data, offset)
+            offset += self.EVENT_HEADER.size
+            names.append(os.fsdecode(data[offset:offset + length].rstrip(b"\0")))
+            offset += length
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+class DatasetWatcher:
+    """
+    Vigila dataset/ en un hilo y llama a on_change() cuando se agregan,
+    modifican o eliminan imágenes, una vez que los cambios se calman durante
+    DATASET_WATCH_DEBOUNCE_SECONDS. Usa inotify en Linux y, si no está
+    disponible, compara tamaño y fecha de modificación cada
+    DATASET_POLL_INTERVAL_SECONDS.
+    """
+    def __init__(self, dataset_dir, on_change, use_inotify=None):
+        self.dataset_dir = dataset_dir
+        self.on_change = on_change
+        self.use_inotify = sys.platform.startswith("linux") if use_inotify is None else use_inotify
+        self.mode = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        inotify = None
+        if self.use_inotify:
+            try:
+                inotify = _Inotify(self.dataset_dir)
+            except (OSError, AttributeError):
+                inotify = None
+        self.mode = "inotify" if inotify is not None else "polling"
+        target = self._run_inotify if inotify is not None else self._run_polling
+        self._thread = threading.Thread(target=target, args=(inotify,) if inotify else (),
+                                        name="dataset-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
+
+    def _notify(self):
+        try:
+            self.on_change()
+        except Exception:
+            # Un error al codificar no debe detener la vigilancia
+            logger.exception("Error al actualizar la galería tras un cambio en %s", self.dataset_dir)
+
+    def _run_inotify(self, inotify):
+        try:
+            pending = False
+            while not self._stop.is_set():
+                names = inotify.wait(DATASET_WATCH_DEBOUNCE_SECONDS if pending else 0.5)
+                if any(name.lower().endswith(DATASET_IMAGE_EXTENSIONS) for name in names):
+                    pending = True
+                elif pending and not names:
+                    pending = False
+                    self._notify()
+        finally:
+            inotify.close()
+
+    def _snapshot(self):
+        snapshot = {}
+        try:
+            with os.scandir(self.dataset_dir) as entries:
+                for entry in entries:
+                    if entry.name.lower().endswith(DATASET_IMAGE_EXTENSIONS):
+                        st = entry.stat()
+                        snapshot[entry.name] = (st.st_size, st.st_mtime_ns)
+        except FileNotFoundError:
+            pass
+        return snapshot
+
+    def _run_polling(self):
+        previous = self._snapshot()
+        changed_at = None
+        while not self._stop.wait(DATASET_POLL_INTERVAL_SECONDS):
+            current = self._snapshot()
+            if current != previous:
+                previous = current
+                changed_at = time.monotonic()
+            elif changed_at is not None and time.monotonic() - changed_at >= DATASET_WATCH_DEBOUNCE_SECONDS:
+                changed_at = None
+                self._notify()
+
+# ------------------------------------------------------------
+# Motor de reconocimiento compartido por todas las ventanas
+# ------------------------------------------------------------
+class RecognitionEngine:
+    """
+    Galería y comparadores de rostros de todo el proceso. Las ventanas se
+    destruyen y se vuelven a crear al navegar, pero el motor se carga una sola
+    vez (en la precarga del login o al abrir la primera ventana de asistencia)
+    y lo comparten todas; los alumnos nuevos se agregan con add_student.
+
+    Con start_watching() los cambios en dataset/ se codifican en segundo plano
+    (solo los archivos nuevos o modificados) y la galería se reemplaza entera
+    por una nueva: quien ya tomó self.gallery termina con la versión anterior
+    y nunca ve una matriz a medio actualizar.
+    """
+    def __init__(self, dataset_dir):
+        self.dataset_dir = dataset_dir
+        self.index_dir = os.path.join(os.path.dirname(dataset_dir), "gallery_index")
+        self.names = []
+        self.encodings = []
+        self.gallery = None
+        self.listeners = []  # Funciones (recomputadas, eliminadas) llamadas tras cada actualización
+        self._listeners_lock = threading.Lock()  # Se agregan desde Tk y se recorren desde el vigilante
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._generation = 0  # Cambia con cada add_student
+        self._watcher = None
+
+    @property
+    def loaded(self):
+        return self.gallery is not None
+
+    def add_listener(self, listener):
+        with self._listeners_lock:
+            self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self._listeners_lock:
+            if listener in self.listeners:
+                self.listeners.remove(listener)
+
+    def load(self, on_message=None):
+        """
+        Carga la galería si todavía no está cargada y devuelve (recomputadas,
+        eliminadas) de la caché de dataset/; si ya estaba cargada devuelve (0, 0).
+        Si otro hilo la está cargando, espera a que termine.
+        """
+        with self._lock:
+            if self.gallery is not None:
+                return 0, 0
+            # Imágenes de dataset/ para alumnos que aún no tienen su codificación
+            # guardada en students.dataset (ver backfill-encodings)
+            names, encodings, recomputed, removed = FaceEncodingCache(self.dataset_dir).refresh(
+                on_message=on_message)
+            self.names, self.encodings = names, encodings
+            self.gallery = FaceGallery(names, encodings, index_dir=self.index_dir)
+            return recomputed, removed
+
+    def refresh_dataset(self):
+        """Codifica los cambios de dataset/ y publica una galería nueva; devuelve (recomputadas, eliminadas)."""
+        with self._refresh_lock:
+            names, encodings, recomputed, removed = FaceEncodingCache(self.dataset_dir).refresh()
+            if not (recomputed or removed):
+                return 0, 0
+            while True:
+                with self._lock:
+                    current, generation = self.gallery, self._generation
+                # Se arma fuera del candado: identify() sigue con la galería actual mientras tanto
+                gallery = FaceGallery(names, encodings, index_dir=self.index_dir)
+                if current is not None:
+                    gallery.preload_like(current)
+                with self._lock:
+                    if self._generation == generation:
+                        self.names, self.encodings = names, encodings
+                        self.gallery = gallery
+                        break
+                # Un add_student llegó mientras tanto: ya está en students, se vuelve a armar
+        with self._listeners_lock:
+            listeners = list(self.listeners)
+        for listener in listeners:
+            listener(recomputed, removed)
+        return recomputed, removed
+
+    def start_watching(self):
+        """Empieza a vigilar dataset/ (una sola vez por proceso); devuelve el modo usado."""
+        with self._lock:
+            if self._watcher is None and os.path.isdir(self.dataset_dir):
+                self._watcher = DatasetWatcher(self.dataset_dir, self.refresh_dataset)
+                self._watcher.start()
+            return self._watcher.mode if self._watcher is not None else None
+
+    def add_student(self, code, grade, section, encodings):
+        """Incorpora a un alumno recién matriculado sin recargar la galería."""
+        with self._lock:
+            self._generation += 1
+            if self.gallery is not None:
+                self.gallery.add_student(code, grade, section, encodings)
+
+    def matcher_for(self, grade, section):
+        self.load()
+        return self.gallery.matcher_for(grade, section)
+
+    def identify(self, face_encodings, grade, section, fallback=False):
+        self.load()
+        return self.gallery.identify(face_encodings, grade, section, fallback=fallback)
+
+_recognition_engine = None
+_recognition_engine_lock = threading.Lock()
+
+def get_recognition_engine():
+    """Devuelve el RecognitionEngine del proceso (con dataset/ junto al script)."""
+    global _recognition_engine
+    with _recognition_engine_lock:
+        if _recognition_engine is None:
+            script_dir = os.path.dirname(os.path.abspath(__file__))
+            _recognition_engine = RecognitionEngine(os.path.join(script_dir, "dataset"))
+        return _recognition_engine
+
+# ------------------------------------------------------------
+# Detección en resolución reducida
+# ------------------------------------------------------------
+# Escala de detección: "auto", un factor (p. ej. 0.25 o 0.5) o un entero > 1
+# que indica el lado mayor objetivo en píxeles.
+DETECTION_SCALE = "auto"
+MIN_EXPECTED_FACE_SIZE = 80  # Rostro más pequeño esperado, en píxeles de la imagen original
+HOG_MIN_FACE_SIZE = 40       # Rostro más pequeño que detecta HOG con un upsample
+MIN_DETECTION_LONG_EDGE = 320
+
+def resolve_detection_scale(shape, detection_scale=DETECTION_SCALE, min_face_size=MIN_EXPECTED_FACE_SIZE):
+    """Factor (<= 1) al que se reduce la imagen antes de buscar rostros."""
+    long_edge = max(shape[:2])
+    if detection_scale == "auto":
+        # Se reduce hasta que el rostro más pequeño esperado quede al límite de
+        # lo que HOG detecta, sin bajar de MIN_DETECTION_LONG_EDGE de lado mayor.
+        scale = max(HOG_MIN_FACE_SIZE / float(min_face_size), MIN_DETECTION_LONG_EDGE / float(long_edge))
+    elif isinstance(detection_scale, int) and detection_scale > 1:
+        scale = detection_scale / float(long_edge)
+    else:
+        scale = float(detection_scale)
+    return min(1.0, scale)
+
+def locate_faces(rgb_image, detection_scale=DETECTION_SCALE):
+    """
+    Busca rostros en una copia reducida de la imagen y devuelve las cajas
+    (top, right, bottom, left) en coordenadas de la imagen original.
+    """
+    with metrics.timer("face_locations"):
+        scale = resolve_detection_scale(rgb_image.shape, detection_scale)
+        if scale >= 1.0:
+            return face_recognition.face_locations(rgb_image)
+
+        small = cv2.resize(rgb_image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        height, width = rgb_image.shape[:2]
+        return [(max(0, int(top / scale)), min(width, int(right / scale)),
+                 min(height, int(bottom / scale)), max(0, int(left / scale)))
+                for top, right, bottom, left in face_recognition.face_locations(small)]
+
+def detect_and_encode(rgb_image, detection_scale=DETECTION_SCALE):
+    """Detecta en resolución reducida y codifica con los píxeles originales."""
+    face_locations = locate_faces(rgb_image, detection_scale)
+    if not face_locations:
+        return [], []
+    return face_locations, encode_faces(rgb_image, face_locations)
+
+def encode_faces(rgb_image, face_locations):
+    with metrics.timer("face_encodings"):
+        metrics.count("faces_encoded", len(face_locations))
+        return face_recognition.face_encodings(rgb_image, face_locations)
+
+# ------------------------------------------------------------
+# Seguimiento de rostros entre frames
+# ------------------------------------------------------------
+TRACK_IOU_THRESHOLD = 0.3
+TRACK_MAX_MISSED = 3      # Frames muestreados sin ver la pista antes de descartarla
+TRACK_REVERIFY_EVERY = 3  # Cada cuántos frames se vuelve a intentar una pista sin reconocer
+
+def box_iou(a, b):
+    """IoU entre dos cajas (top, right, bottom, left)."""
+    top, bottom = max(a[0], b[0]), min(a[2], b[2])
+    left, right = max(a[3], b[3]), min(a[1], b[1])
+    inter = max(0, bottom - top) * max(0, right - left)
+    area_a = (a[2] - a[0]) * (a[1] - a[3])
+    area_b = (b[2] - b[0]) * (b[1] - b[3])
+    union = area_a + area_b - inter
+    return inter / union if union > 0 else 0.0
+
+class FaceTracker:
+    """
+    Asocia las cajas de rostros de frames muestreados consecutivos por IoU.
+    Solo las pistas nuevas (y, cada TRACK_REVERIFY_EVERY frames, las que aún no
+    se reconocieron) necesitan codificarse; una pista ya asociada a un alumno
+    no vuelve a pasar por la red neuronal.
+    """
+    def __init__(self, iou_threshold=TRACK_IOU_THRESHOLD, max_missed=TRACK_MAX_MISSED,
+                 reverify_every=TRACK_REVERIFY_EVERY):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.reverify_every = reverify_every
+        self.tracks = {}
+        self._next_id = 0
+
+    def update(self, boxes):
+        """
+        Asocia las cajas del frame actual con las pistas existentes y devuelve,
+        alineada con boxes, una lista de (id de pista, necesita codificarse).
+        """
+        pairs = sorted(((box_iou(track["box"], box), track_id, i)
+                        for track_id, track in self.tracks.items()
+                        for i, box in enumerate(boxes)), reverse=True)
+        assigned = {}
+        used_tracks = set()
+        for iou, track_id, i in pairs:
+            if iou < self.iou_threshold:
+                break
+            if i in assigned or track_id in used_tracks:
+                continue
+            assigned[i] = track_id
+            used_tracks.add(track_id)
+
+        for track_id in list(self.tracks):
+            if track_id not in used_tracks:
+                self.tracks[track_id]["missed"] += 1
+                if self.tracks[track_id]["missed"] > self.max_missed:
+                    del self.tracks[track_id]
+
+        result = []
+        for i, box in enumerate(boxes):
+            track_id = assigned.get(i)
+            if track_id is None:
+                track_id = self._next_id
+                self._next_id += 1
+                self.tracks[track_id] = {"box": box, "code": None, "missed": 0, "since_check": 0}
+                result.append((track_id, True))
+                continue
+
+            track = self.tracks[track_id]
+            track["box"] = box
+            track["missed"] = 0
+            if track["code"] is not None:
+                result.append((track_id, False))
+            else:
+                track["since_check"] += 1
+                result.append((track_id, track["since_check"] >= self.reverify_every))
+        return result
+
+    def resolve(self, track_id, code):
+        """Registra el resultado de codificar y comparar el rostro de una pista."""
+        track = self.tracks.get(track_id)
+        if track is not None:
+            track["since_check"] = 0
+            if code is not None:
+                track["code"] = code
+
+# ------------------------------------------------------------
+# Modo "salón completo": terminar cuando ya no falta nadie
+# ------------------------------------------------------------
+ROSTER_IDLE_TIMEOUT_SECONDS = 10  # Segundos sin identidades nuevas antes de detenerse
+
+def load_roster(grade, section):
+    """Códigos de los alumnos registrados en un grado y sección."""
+    rows = db.fetchall("SELECT student_code FROM students WHERE grade=? AND section=?", (grade, section))
+    return {row[0] for row in rows}
+
+class RosterProgress:
+    """
+    Lleva la cuenta de qué alumnos esperados faltan por reconocer e indica
+    cuándo conviene dejar de procesar: cuando ya no falta nadie o cuando pasan
+    idle_timeout segundos sin que aparezca una identidad nueva. La espera
+    empieza con la primera identidad reconocida: si los alumnos entran tarde,
+    el video no se corta antes de ver a nadie. El tiempo lo aporta quien llama
+    (segundos de video o de grabación).
+    """
+    def __init__(self, expected_codes, idle_timeout=ROSTER_IDLE_TIMEOUT_SECONDS):
+        self.expected = set(expected_codes)
+        self.found = set()
+        self.idle_timeout = idle_timeout
+        self.last_new_at = None
+
+    @property
+    def missing(self):
+        return self.expected - self.found
+
+    @property
+    def can_complete(self):
+        """False si no se espera a nadie: entonces solo se detiene por inactividad."""
+        return bool(self.expected)
+
+    def add(self, codes, now):
+        new_codes = set(codes) - self.found
+        if new_codes:
+            self.found |= new_codes
+            self.last_new_at = now
+        return new_codes
+
+    def stop_reason(self, now):
+        """Motivo para detenerse, o None si hay que seguir procesando."""
+        if self.can_complete and not self.missing:
+            return "complete"
+        if self.idle_timeout and self.last_new_at is not None and now - self.last_new_at >= self.idle_timeout:
+            return "idle"
+        return None
+
+# ------------------------------------------------------------
+# Pipeline de reconocimiento de video en paralelo
+# ------------------------------------------------------------
+VIDEO_SAMPLE_EVERY_N_FRAMES = 5  # Procesar 1 de cada 5 frames
+VIDEO_PIPELINE_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+
+_worker_frames = {}  # Memorias compartidas abiertas en cada proceso trabajador
+WORKER_FRAMES_MAX_OPEN = 4  # Un grupo de procesos reutilizado atiende varios videos
+
+def _attach_shared_frames(shm_name, shape):
+    """Abre (una sola vez por proceso) la memoria compartida con las ranuras de frames."""
+    entry = _worker_frames.get(shm_name)
+    if entry is None:
+        # Cerrar las más antiguas para no retener la memoria de videos ya terminados
+        while len(_worker_frames) >= WORKER_FRAMES_MAX_OPEN:
+            old_shm, _ = _worker_frames.pop(next(iter(_worker_frames)))
+            old_shm.close()
+        shm = shared_memory.SharedMemory(name=shm_name)
+        entry = (shm, np.ndarray(shape, dtype=np.uint8, buffer=shm.buf))
+        _worker_frames[shm_name] = entry
+    return entry[1]
+
+_video_pools = {}  # workers -> ProcessPoolExecutor que se conserva entre videos
+_video_pools_lock = threading.Lock()
+
+def get_video_pool(workers):
+    """
+    Grupo de procesos de VideoRecognitionPipeline, uno por proceso y por
+    cantidad de trabajadores: se crea con el primer video y los siguientes lo
+    reutilizan, así los trabajadores cargan los modelos de dlib una sola vez.
+    """
+    with _video_pools_lock:
+        pool = _video_pools.get(workers)
+        if pool is None:
+            if os.name == "posix":
+                # Los trabajadores deben heredar el resource_tracker del proceso principal
+                # (en Windows no hay resource_tracker: la memoria la libera el sistema)
+                resource_tracker.ensure_running()
+            pool = _video_pools[workers] = ProcessPoolExecutor(max_workers=workers)
+        return pool
+
+def _discard_video_pool(pool):
+    """Olvida un grupo roto (murió un trabajador); el próximo video crea otro."""
+    with _video_pools_lock:
+        for workers, cached in list(_video_pools.items()):
+            if cached is pool:
+                del _video_pools[workers]
+    pool.shutdown(wait=False)
+
+def _shutdown_video_pools():
+    with _video_pools_lock:
+        pools = list(_video_pools.values())
+        _video_pools.clear()
+    for pool in pools:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+atexit.register(_shutdown_video_pools)
+
+def _locate_faces_slot(shm_name, shape, slot, detection_scale):
+    """Trabajo de un proceso: detecta los rostros del frame BGR en la ranura (y cuánto tardó)."""
+    start = time.perf_counter()
+    frames = _attach_shared_frames(shm_name, shape)
+    rgb_frame = np.ascontiguousarray(frames[slot][:, :, ::-1])
+    return locate_faces(rgb_frame, detection_scale), time.perf_counter() - start
+
+def _encode_faces_slot(shm_name, shape, slot, face_locations):
+    """Trabajo de un proceso: codifica las cajas indicadas del frame en la ranura (y cuánto tardó)."""
+    start = time.perf_counter()
+    frames = _attach_shared_frames(shm_name, shape)
+    rgb_frame = np.ascontiguousarray(frames[slot][:, :, ::-1])
+    encodings = [np.asarray(e, dtype=np.float32) for e in face_recognition.face_encodings(rgb_frame, face_locations)]
+    return encodings, time.perf_counter() - start
+
+class VideoRecognitionPipeline:
+    """
+    Reconoce los rostros de un video en tres etapas:
+    - un hilo decodificador copia los frames muestreados a ranuras de memoria
+      compartida (la cantidad de ranuras acota la cola de frames);
+    - un grupo de procesos detecta rostros leyendo esas ranuras, sin
+      serializar los píxeles;
+    - un único agregador sigue las pistas de rostros en orden (FaceTracker),
+      pide codificar solo los rostros que lo necesitan, compara contra la
+      galería y elimina duplicados.
+    Con workers=0 todo se hace en serie en el hilo que llama a run().
+
+    Con pool se reutiliza un ProcessPoolExecutor ya creado (por ejemplo, el
+    del procesamiento por lotes); si no, el del proceso (get_video_pool). En
+    ambos casos workers indica cuántos frames se procesan a la vez. Los
+    frames con otra resolución que el primero no caben en las ranuras: se
+    omiten y se cuentan en "skipped_frames".
+
+    Si se pasa un RosterProgress, la lectura del video se detiene en cuanto
+    el salón está completo o deja de haber identidades nuevas. on_progress,
+    si se indica, se llama desde el agregador tras cada frame muestreado con
+    las estadísticas y los códigos reconocidos por primera vez en ese frame.
+    """
+    def __init__(self, identify, workers=VIDEO_PIPELINE_WORKERS, sample_every=VIDEO_SAMPLE_EVERY_N_FRAMES,
+                 detection_scale=DETECTION_SCALE, roster=None, on_progress=None, pool=None):
+        self.identify = identify
+        self.workers = workers
+        self.pool = pool
+        self.sample_every = sample_every
+        self.detection_scale = detection_scale
+        self.roster = roster
+        self.on_progress = on_progress
+        self._stop = threading.Event()
+
+    def stop(self):
+        """Pide terminar: no se leen más frames y se procesan los ya encolados."""
+        self._stop.set()
+
+    def run(self, video_path):
+        """Devuelve (códigos reconocidos, estadísticas de rendimiento)."""
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            raise IOError(f"No se pudo abrir el video: {video_path}")
+
+        stats = {"frames": 0, "sampled_frames": 0, "skipped_frames": 0, "faces": 0, "encodes": 0, "errors": 0,
+                 "stop_reason": None}
+        presentes = set()
+        tracker = FaceTracker()
+        self._stop.clear()
+        self._reported = set()
+        self._video_fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        start = time.perf_counter()
+        try:
+            if self.workers <= 0:
+                self._run_serial(cap, tracker, presentes, stats)
+            else:
+                self._run_parallel(cap, tracker, presentes, stats)
+        finally:
+            cap.release()
+
+        stats["seconds"] = time.perf_counter() - start
+        stats["fps"] = stats["frames"] / stats["seconds"] if stats["seconds"] else 0.0
+        metrics.count("video_frames", stats["frames"])
+        stats["encodes_saved"] = stats["faces"] - stats["encodes"]
+        return presentes, stats
+
+    def recognize_tracked(self, face_locations, encode, tracker, presentes, stats):
+        """
+        Actualiza las pistas con las cajas detectadas y codifica/compara solo
+        los rostros que lo necesitan; encode(cajas) devuelve las codificaciones.
+        Suma "faces" y "encodes" en stats y agrega los códigos a presentes.
+        """
+        stats["faces"] += len(face_locations)
+        tracks = tracker.update(face_locations)
+        pending = [(track_id, box) for (track_id, needs_encoding), box in zip(tracks, face_locations)
+                   if needs_encoding]
+        if not pending:
+            return
+        face_encodings = encode([box for _, box in pending])
+        stats["encodes"] += len(face_encodings)
+        for (track_id, _), code in zip(pending, self.identify(face_encodings)):
+            tracker.resolve(track_id, code)
+            if code is not None:
+                presentes.add(code)
+
+    def _check_roster(self, presentes, frame_index, stats):
+        """Actualiza el avance del salón y pide detenerse si ya no hace falta seguir."""
+        if self.on_progress is not None:
+            new_codes = presentes - self._reported
+            self._reported |= new_codes
+            self.on_progress(stats, new_codes)
+        if self.roster is None:
+            return
+        video_seconds = frame_index / self._video_fps
+        self.roster.add(presentes, video_seconds)
+        reason = self.roster.stop_reason(video_seconds)
+        if reason and not stats["stop_reason"]:
+            stats["stop_reason"] = reason
+            self.stop()
+
+    def recognize_frame(self, frame, tracker, presentes, stats):
+        """Detecta, sigue y reconoce los rostros de un frame BGR en el hilo actual."""
+        stats["sampled_frames"] += 1
+        try:
+            rgb_frame = np.ascontiguousarray(frame[:, :, ::-1])
+            face_locations = locate_faces(rgb_frame, self.detection_scale)
+            self.recognize_tracked(face_locations, lambda boxes: encode_faces(rgb_frame, boxes),
+                                   tracker, presentes, stats)
+        except Exception:
+            stats["errors"] += 1
+
+    @staticmethod
+    def _encode_in_pool(pool, shm_name, shape, slot, boxes):
+        encodings, seconds = pool.submit(_encode_faces_slot, shm_name, shape, slot, boxes).result()
+        metrics.observe("face_encodings", seconds)
+        metrics.count("faces_encoded", len(boxes))
+        return encodings
+
+    def _run_serial(self, cap, tracker, presentes, stats):
+        while not self._stop.is_set():
+            with metrics.timer("decode"):
+                ret, frame = cap.read()
+            if not ret:
+                break
+            stats["frames"] += 1
+            if stats["frames"] % self.sample_every != 0:
+                continue
+            self.recognize_frame(frame, tracker, presentes, stats)
+            self._check_roster(presentes, stats["frames"], stats)
+
+    def _run_parallel(self, cap, tracker, presentes, stats):
+        ret, first_frame = cap.read()
+        if not ret:
+            return
+
+        n_slots = self.workers + 2
+        shape = (n_slots,) + first_frame.shape
+        shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)))
+        frames = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+        free_slots = queue.Queue()
+        for slot in range(n_slots):
+            free_slots.put(slot)
+        pending = queue.Queue()
+        done = object()
+
+        def decode(pool):
+            frame = first_frame
+            try:
+                while frame is not None and not self._stop.is_set():
+                    stats["frames"] += 1
+                    if stats["frames"] % self.sample_every == 0 and frame.shape != first_frame.shape:
+                        stats["skipped_frames"] += 1
+                    elif stats["frames"] % self.sample_every == 0:
+                        slot = free_slots.get()  # Bloquea si todas las ranuras están ocupadas
+                        frames[slot] = frame
+                        future = pool.submit(_locate_faces_slot, shm.name, shape, slot, self.detection_scale)
+                        pending.put((slot, stats["frames"], future))
+                    with metrics.timer("decode"):
+                        ret, frame = cap.read()
+                    if not ret:
+                        frame = None
+            finally:
+                pending.put(done)
+
+        decoder = None
+        decoded_all = False
+        try:
+            pool = self.pool if self.pool is not None else get_video_pool(self.workers)
+            decoder = threading.Thread(target=decode, args=(pool,), daemon=True)
+            decoder.start()
+            while True:
+                item = pending.get()
+                if item is done:
+                    decoded_all = True
+                    break
+                slot, frame_index, future = item
+                stats["sampled_frames"] += 1
+                try:
+                    # El frame sigue en su ranura hasta que el agregador la libera,
+                    # así la codificación también se hace en un proceso trabajador.
+                    face_locations, seconds = future.result()
+                    metrics.observe("face_locations", seconds)
+                    self.recognize_tracked(
+                        face_locations,
+                        lambda boxes: self._encode_in_pool(pool, shm.name, shape, slot, boxes),
+                        tracker, presentes, stats)
+                except Exception as e:
+                    stats["errors"] += 1
+                    if isinstance(e, BrokenProcessPool) and self.pool is None:
+                        _discard_video_pool(pool)
+                finally:
+                    free_slots.put(slot)
+                self._check_roster(presentes, frame_index, stats)
+        finally:
+            if decoder is not None:
+                if not decoded_all:
+                    # Falló el agregador (p. ej. on_progress): se detiene el decodificador y se
+                    # esperan los trabajos que leen las ranuras antes de liberar la memoria
+                    self._stop.set()
+                    while True:
+                        item = pending.get()
+                        if item is done:
+                            break
+                        slot, _, future = item
+                        if not future.cancel():
+                            future.exception()
+                        free_slots.put(slot)
+                decoder.join()
+            del frames
+            shm.close()
+            shm.unlink()
+
+# ------------------------------------------------------------
+# Reconocimiento en vivo desde la cámara
+# ------------------------------------------------------------
+LIVE_RECOGNITION_FPS = 4   # Frames por segundo que se analizan en modo en vivo
+LIVE_CONFIRM_FRAMES = 3    # Frames analizados consecutivos para confirmar a un alumno
+
+class CameraCapture:
+    """
+    Lee la cámara en su propio hilo y conserva siempre el último frame, de
+    modo que la vista previa no pierde frames mientras corre la inferencia.
+    on_frame, si se indica, recibe cada frame leído desde el hilo de captura.
+    """
+    def __init__(self, source=0, on_frame=None):
+        self.cap = cv2.VideoCapture(source)
+        self.on_frame = on_frame
+        self.failed = False
+        self._frame = None
+        self._frame_id = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def is_opened(self):
+        return self.cap.isOpened()
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="camera-capture", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            ret, frame = self.cap.read()
+            if not ret:
+                self.failed = True
+                break
+            with self._lock:
+                self._frame = frame
+                self._frame_id += 1
+            if self.on_frame is not None:
+                self.on_frame(frame)
+
+    def latest(self):
+        """Devuelve (número de frame, último frame BGR) o (0, None) si aún no hay."""
+        with self._lock:
+            return self._frame_id, self._frame
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+        self.cap.release()
+
+class LiveRecognizer:
+    """
+    Analiza en un hilo aparte el último frame de una CameraCapture a
+    target_fps, directamente desde memoria. Un alumno queda confirmado cuando
+    se reconoce en confirm_frames frames analizados consecutivos; los códigos
+    confirmados se entregan una sola vez por la cola 'confirmed'.
+    """
+    def __init__(self, capture, identify, target_fps=LIVE_RECOGNITION_FPS,
+                 confirm_frames=LIVE_CONFIRM_FRAMES, detection_scale=DETECTION_SCALE):
+        self.capture = capture
+        self.identify = identify
+        self.interval = 1.0 / target_fps
+        self.confirm_frames = confirm_frames
+        self.detection_scale = detection_scale
+        self.confirmed = queue.Queue()
+        self._confirmed_codes = set()
+        self._streaks = {}
+        self._results = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="live-recognizer", daemon=True)
+        self._thread.start()
+
+    def results(self):
+        """Última lista de (caja, código o None, confirmado) para dibujar en la vista previa."""
+        with self._lock:
+            return list(self._results)
+
+    def _analyze(self, frame):
+        rgb_frame = np.ascontiguousarray(frame[:, :, ::-1])
+        face_locations, face_encodings = detect_and_encode(rgb_frame, self.detection_scale)
+        codes = self.identify(face_encodings) if face_encodings else []
+
+        seen = {code for code in codes if code is not None}
+        self._streaks = {code: self._streaks.get(code, 0) + 1 for code in seen}
+        for code in seen:
+            if self._streaks[code] >= self.confirm_frames and code not in self._confirmed_codes:
+                self._confirmed_codes.add(code)
+                self.confirmed.put(code)
+
+        results = [(box, code, code in self._confirmed_codes) for box, code in zip(face_locations, codes)]
+        with self._lock:
+            self._results = results
+
+    def _run(self):
+        last_id = 0
+        while not self._stop.is_set():
+            started = time.monotonic()
+            frame_id, frame = self.capture.latest()
+            if frame is None or frame_id == last_id:
+                self._stop.wait(0.01)
+                continue
+            last_id = frame_id
+            try:
+                self._analyze(frame)
+            except Exception:
+                pass
+            self._stop.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
+
+class StreamingRecognizer:
+    """
+    Reconoce en un hilo aparte los frames que se le entregan con feed()
+    mientras se graba, usando recognize_frame del pipeline. La cola es corta:
+    si el reconocimiento va atrasado se descarta el frame más antiguo en lugar
+    de frenar la captura. finish() procesa lo pendiente y devuelve los
+    resultados, que quedan listos en cuanto termina la grabación.
+    """
+    def __init__(self, pipeline, max_pending=2):
+        self.pipeline = pipeline
+        self.tracker = FaceTracker()
+        self.stats = {"sampled_frames": 0, "faces": 0, "encodes": 0, "errors": 0, "dropped": 0}
+        self._presentes = set()
+        self._lock = threading.Lock()
+        self._frames = queue.Queue(maxsize=max_pending)
+        self._done = object()
+        self._thread = threading.Thread(target=self._run, name="streaming-recognizer", daemon=True)
+        self._thread.start()
+
+    def feed(self, frame):
+        while True:
+            try:
+                self._frames.put_nowait(frame)
+                return
+            except queue.Full:
+                try:
+                    self._frames.get_nowait()
+                    self.stats["dropped"] += 1
+                except queue.Empty:
+                    pass
+
+    def recognized(self):
+        with self._lock:
+            return set(self._presentes)
+
+    def _run(self):
+        while True:
+            frame = self._frames.get()
+            if frame is self._done:
+                break
+            presentes = set()
+            self.pipeline.recognize_frame(frame, self.tracker, presentes, self.stats)
+            with self._lock:
+                self._presentes |= presentes
+
+    def finish(self):
+        """Espera a que se reconozcan los frames pendientes y devuelve (presentes, stats)."""
+        self._frames.put(self._done)
+        self._thread.join()
+        return self.recognized(), self.stats
+
+def draw_recognitions(frame, results):
+    """Dibuja cajas y nombres: verde confirmado, amarillo reconocido, rojo desconocido."""
+    for (top, right, bottom, left), code, confirmed in results:
+        if code is None:
+            color, label = (0, 0, 255), "Desconocido"
+        elif confirmed:
+            color, label = (0, 200, 0), code
+        else:
+            color, label = (0, 200, 255), code
+        cv2.rectangle(frame, (left, top), (right, bottom), color, 2)
+        cv2.putText(frame, label, (left, max(15, top - 8)), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+    return frame
+
+# ------------------------------------------------------------
+# Varias cámaras a la vez con un reconocedor compartido
+# ------------------------------------------------------------
+MULTICAM_IDLE_WAIT_SECONDS = 0.005
+
+def parse_video_source(source):
+    """'0' -> cámara 0; cualquier otro texto (archivo, rtsp://...) se usa tal cual."""
+    return int(source) if str(source).isdigit() else source
+
+class CameraStream:
+    """
+    Una fuente de video con su propio hilo de captura (CameraCapture). Guarda
+    solo el último frame muestreado: si el reconocedor no alcanza, el frame
+    anterior se descarta y se cuenta en 'dropped', así la latencia no crece.
+    Los archivos se leen a su velocidad nominal, como si fueran una cámara.
+
+    Como cada fuente tiene a lo sumo un frame en curso, le basta una ranura
+    de memoria compartida (share()) para que los procesos trabajadores lean
+    los píxeles sin serializarlos, igual que VideoRecognitionPipeline.
+    """
+    def __init__(self, name, source, sample_every=VIDEO_SAMPLE_EVERY_N_FRAMES):
+        self.name = name
+        self.source = parse_video_source(source)
+        self.sample_every = sample_every
+        self.tracker = FaceTracker()
+        self.presentes = set()
+        self.in_flight = False
+        self.latency = LatencyHistogram()
+        self.stats = {"frames": 0, "sampled_frames": 0, "processed": 0, "dropped": 0,
+                      "faces": 0, "encodes": 0, "errors": 0}
+        self._pending = None
+        self._lock = threading.Lock()  # stats y _pending: hilos de captura y del despachador
+        self._shm = None
+        self._shm_frames = None
+        self.capture = CameraCapture(self.source, on_frame=self._on_frame)
+        fps = self.capture.cap.get(cv2.CAP_PROP_FPS) if isinstance(self.source, str) else 0
+        self._frame_interval = 1.0 / fps if fps and fps > 0 and os.path.isfile(self.source) else 0.0
+        self._next_frame_at = None
+        self.started_at = None
+        self.last_activity_at = None
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self.capture.start()
+
+    def _on_frame(self, frame):
+        if self._frame_interval:
+            now = time.perf_counter()
+            if self._next_frame_at is not None and self._next_frame_at > now:
+                time.sleep(self._next_frame_at - now)
+            self._next_frame_at = max(now, self._next_frame_at or now) + self._frame_interval
+        self.last_activity_at = time.perf_counter()
+        with self._lock:
+            self.stats["frames"] += 1
+            if self.stats["frames"] % self.sample_every:
+                return
+            self.stats["sampled_frames"] += 1
+            if self._pending is not None:
+                self.stats["dropped"] += 1
+            self._pending = (frame, time.perf_counter())
+
+    def take(self):
+        """Devuelve (frame, momento de captura) pendiente, o None."""
+        with self._lock:
+            item, self._pending = self._pending, None
+            return item
+
+    def count(self, **increments):
+        with self._lock:
+            for key, value in increments.items():
+                self.stats[key] += value
+
+    def share(self, frame):
+        """Copia el frame a la ranura compartida de la fuente y devuelve (nombre, forma) para los trabajadores."""
+        if self._shm_frames is None or self._shm_frames.shape[1:] != frame.shape:
+            # Primer frame o la cámara cambió de resolución
+            self.release_shared()
+            self._shm = shared_memory.SharedMemory(create=True, size=frame.nbytes)
+            self._shm_frames = np.ndarray((1,) + frame.shape, dtype=np.uint8, buffer=self._shm.buf)
+        self._shm_frames[0] = frame
+        return self._shm.name, self._shm_frames.shape
+
+    def release_shared(self):
+        if self._shm is not None:
+            self._shm_frames = None
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    @property
+    def finished(self):
+        return not self.capture.is_running() and self._pending is None and not self.in_flight
+
+    def report(self):
+        # Hasta el último frame o reconocimiento, para no diluir los fps de una fuente que ya terminó
+        elapsed = (self.last_activity_at or self.started_at or 0.0) - (self.started_at or 0.0)
+        with self._lock:
+            row = dict(self.stats)
+        row.update({"name": self.name, "source": str(self.source),
+                    "capture_fps": row["frames"] / elapsed if elapsed else 0.0,
+                    "processed_fps": row["processed"] / elapsed if elapsed else 0.0,
+                    "latency_p50_ms": self.latency.percentile(50),
+                    "latency_p95_ms": self.latency.percentile(95),
+                    "recognized": len(self.presentes)})
+        return row
+
+class MultiCameraRecognizer:
+    """
+    Reconoce varias fuentes a la vez con un solo grupo de procesos. Un hilo
+    despachador recorre las fuentes en turno rotativo y envía el último frame
+    de cada una, con a lo sumo un frame en curso por fuente y 'workers' en
+    total: ninguna cámara acapara el grupo aunque produzca más frames. Cada
+    fuente tiene su FaceTracker; los alumnos reconocidos se combinan entre
+    todas y on_recognized(nombre de la fuente, códigos nuevos) se llama solo
+    la primera vez que aparece cada código. Con workers=0 el reconocimiento
+    corre en un único hilo, sin procesos.
+    """
+    def __init__(self, sources, identify, workers=VIDEO_PIPELINE_WORKERS, sample_every=VIDEO_SAMPLE_EVERY_N_FRAMES,
+                 detection_scale=DETECTION_SCALE, on_recognized=None):
+        self.streams = [CameraStream(f"cam{i}", source, sample_every) for i, source in enumerate(sources)]
+        self.pipeline = VideoRecognitionPipeline(identify, workers=0, detection_scale=detection_scale)
+        self.workers = workers
+        self.detection_scale = detection_scale
+        self.on_recognized = on_recognized
+        self.recognized = {}  # código -> fuente donde se vio primero
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._pool = None
+
+    def stop(self):
+        self._stop.set()
+
+    def _recognize(self, stream, frame, presentes, counts):
+        if self._pool is None:
+            rgb_frame = np.ascontiguousarray(frame[:, :, ::-1])
+            self.pipeline.recognize_tracked(locate_faces(rgb_frame, self.detection_scale),
+                                            lambda boxes: encode_faces(rgb_frame, boxes),
+                                            stream.tracker, presentes, counts)
+            return
+        # El frame queda en la ranura de la fuente hasta terminar de codificarlo
+        shm_name, shape = stream.share(frame)
+        face_locations, seconds = self._pool.submit(
+            _locate_faces_slot, shm_name, shape, 0, self.detection_scale).result()
+        metrics.observe("face_locations", seconds)
+        self.pipeline.recognize_tracked(
+            face_locations,
+            lambda boxes: VideoRecognitionPipeline._encode_in_pool(self._pool, shm_name, shape, 0, boxes),
+            stream.tracker, presentes, counts)
+
+    def _handle(self, stream, frame, captured_at):
+        counts = {"faces": 0, "encodes": 0, "errors": 0}
+        try:
+            presentes = set()
+            self._recognize(stream, frame, presentes, counts)
+            stream.presentes |= presentes
+            with self._lock:
+                nuevos = {code for code in presentes if code not in self.recognized}
+                for code in nuevos:
+                    self.recognized[code] = stream.name
+            if nuevos and self.on_recognized is not None:
+                self.on_recognized(stream.name, nuevos)
+        except Exception:
+            counts["errors"] += 1
+            logger.exception("Error al reconocer o registrar un frame de %s (%s)", stream.name, stream.source)
+        finally:
+            stream.count(processed=1, **counts)
+            stream.last_activity_at = time.perf_counter()
+            stream.latency.observe((stream.last_activity_at - captured_at) * 1000.0)
+            stream.in_flight = False
+
+    def run(self, duration=None):
+        """Procesa hasta que terminan todas las fuentes, se llama a stop() o pasa 'duration'; devuelve los informes."""
+        if self.workers > 0:
+            if os.name == "posix":
+                # Los trabajadores deben heredar el resource_tracker para liberar las ranuras una sola vez
+                resource_tracker.ensure_running()
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        dispatcher = ThreadPoolExecutor(max_workers=max(1, self.workers), thread_name_prefix="multicam")
+        for stream in self.streams:
+            if not stream.capture.is_opened():
+                raise IOError(f"No se pudo abrir la fuente: {stream.source}")
+        for stream in self.streams:
+            stream.start()
+
+        deadline = time.perf_counter() + duration if duration else None
+        turn = 0
+        in_flight = 0
+        try:
+            while not self._stop.is_set():
+                if deadline is not None and time.perf_counter() >= deadline:
+                    break
+                in_flight = sum(stream.in_flight for stream in self.streams)
+                submitted = False
+                # Turno rotativo: cada ronda empieza por la fuente siguiente
+                for k in range(len(self.streams)):
+                    if in_flight >= max(1, self.workers):
+                        break
+                    stream = self.streams[(turn + k) % len(self.streams)]
+                    if stream.in_flight:
+                        continue
+                    item = stream.take()
+                    if item is None:
+                        continue
+                    stream.in_flight = True
+                    in_flight += 1
+                    dispatcher.submit(self._handle, stream, *item)
+                    submitted = True
+                turn = (turn + 1) % len(self.streams)
+                if all(stream.finished for stream in self.streams):
+                    break
+                if not submitted:
+                    time.sleep(MULTICAM_IDLE_WAIT_SECONDS)
+        finally:
+            for stream in self.streams:
+                stream.capture.stop()
+            dispatcher.shutdown(wait=True)
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+            for stream in self.streams:
+                stream.release_shared()
+        return [stream.report() for stream in self.streams]
+
+def run_multicam(sources, workers=VIDEO_PIPELINE_WORKERS, grade=None, section=None, duration=None,
+                 username="multicámara", fallback=False):
+    """Punto de entrada del subcomando 'multicam': reconoce y registra asistencia desde varias fuentes."""
+    create_logs_table()
+    migrate_attendance_date_column()
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    engine = get_recognition_engine()
+    engine.load(on_message=lambda msg: print(msg, end=""))
+    attendance_today = DailyAttendance()
+    csv_writer = AttendanceCsvWriter(script_dir)
+
+    def on_recognized(stream_name, codes):
+        nuevos = {code for code in codes if code not in attendance_today}
+        registrados = record_attendance(nuevos, attendance_today, csv_writer, username, grade, section) if nuevos else []
+        print(f"[{stream_name}] Reconocidos: {', '.join(sorted(codes))}"
+              + (f" (asistencia registrada: {', '.join(sorted(registrados))})" if registrados else ""))
+
+    recognizer = MultiCameraRecognizer(
+        sources, lambda encs: engine.identify(encs, grade, section, fallback=fallback),
+        workers=workers, on_recognized=on_recognized)
+    try:
+        reports = recognizer.run(duration)
+    except KeyboardInterrupt:
+        recognizer.stop()
+        reports = [stream.report() for stream in recognizer.streams]
+    finally:
+        csv_writer.close()
+        audit_logger.flush()
+
+    print(f"{'fuente':>6} {'frames':>7} {'fps':>6} {'analizados':>10} {'fps an.':>8} {'descart.':>8} "
+          f"{'lat. p50':>9} {'lat. p95':>9} {'alumnos':>8}")
+    for row in reports:
+        print(f"{row['name']:>6} {row['frames']:>7} {row['capture_fps']:>6.1f} {row['processed']:>10} "
+              f"{row['processed_fps']:>8.1f} {row['dropped']:>8} {row['latency_p50_ms']:>7.0f}ms "
+              f"{row['latency_p95_ms']:>7.0f}ms {row['recognized']:>8}")
+    print(f"Alumnos reconocidos en total (sin duplicados): {len(recognizer.recognized)}")
+    return reports, recognizer.recognized
+
+# ------------------------------------------------------------
+# Trabajos de reconocimiento en segundo plano
+# ------------------------------------------------------------
+class RecognitionJob:
+    """Un archivo a procesar; se puede cancelar mientras espera o mientras corre."""
+    def __init__(self, description):
+        self.description = description
+        self.cancelled = threading.Event()
+        self._pipeline = None
+
+    def attach(self, pipeline):
+        """Asocia el pipeline en curso para poder detenerlo al cancelar."""
+        self._pipeline = pipeline
+        if self.cancelled.is_set():
+            pipeline.stop()
+
+    def cancel(self):
+        self.cancelled.set()
+        if self._pipeline is not None:
+            self._pipeline.stop()
+
+class RecognitionJobRunner:
+    """
+    Ejecuta los trabajos de reconocimiento de a uno en un hilo de fondo para
+    no bloquear el bucle de eventos de Tk; los que llegan mientras tanto
+    esperan en cola en orden de llegada.
+    """
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="recognition")
+        self._jobs = []
+        self._lock = threading.Lock()
+        self.current = None
+
+    def submit(self, description, fn):
+        """Encola fn(job) y devuelve el RecognitionJob correspondiente."""
+        job = RecognitionJob(description)
+        with self._lock:
+            self._jobs.append(job)
+        self._executor.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job, fn):
+        try:
+            if not job.cancelled.is_set():
+                self.current = job
+                fn(job)
+        finally:
+            self.current = None
+            with self._lock:
+                self._jobs.remove(job)
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._jobs)
+
+    def cancel_current(self):
+        job = self.current
+        if job is not None:
+            job.cancel()
+        return job
+
+    def shutdown(self):
+        """Cancela todo lo pendiente sin esperar a que termine."""
+        with self._lock:
+            for job in self._jobs:
+                job.cancel()
+        self._executor.shutdown(wait=False)
+
+# ------------------------------------------------------------
+# Asistencia del día en memoria
+# ------------------------------------------------------------
+class DailyAttendance:
+    """
+    Conjunto de códigos con asistencia registrada hoy. Se carga con una sola
+    consulta y se recarga solo cuando cambia la fecha; quien registra
+    asistencia lo mantiene al día con add().
+    """
+    def __init__(self):
+        self.date = None
+        self.codes = set()
+        self._lock = threading.Lock()
+
+    def _refresh_if_needed(self):
+        today = datetime.now().strftime("%Y-%m-%d")
+        if today == self.date:
+            return
+        rows = db.fetchall("SELECT student_code FROM attendance WHERE date = ?", (today,))
+        self.codes = {row[0] for row in rows}
+        self.date = today
+
+    def __contains__(self, student_code):
+        with self._lock:
+            self._refresh_if_needed()
+            return student_code in self.codes
+
+    def add(self, student_code):
+        with self._lock:
+            self._refresh_if_needed()
+            self.codes.add(student_code)
+
+# ------------------------------------------------------------
+# Registro de asistencia en CSV (solo anexado)
+# ------------------------------------------------------------
+ATTENDANCE_CSV_ROTATION = None  # "monthly" para escribir un archivo por mes
+
+class AttendanceCsvWriter:
+    """
+    Agrega filas a attendance_records.csv sin volver a leer ni reescribir el
+    archivo. Se abre una vez por sesión y cada lote se vacía a disco con
+    flush + fsync. El formato es el mismo que generaba pandas (UTF-8 sin BOM,
+    fin de línea del sistema). Con rotation="monthly" se usa un archivo
+    attendance_records_AAAA_MM.csv por mes.
+    """
+    HEADER = ["Código", "Fecha", "Hora"]
+
+    def __init__(self, directory, rotation=ATTENDANCE_CSV_ROTATION):
+        self.directory = directory
+        self.rotation = rotation
+        self.path = None
+        self._file = None
+        self._writer = None
+        self._lock = threading.Lock()
+
+    def path_for(self, now):
+        if self.rotation == "monthly":
+            return os.path.join(self.directory, f"attendance_records_{now.year}_{now.month:02d}.csv")
+        return os.path.join(self.directory, "attendance_records.csv")
+
+    def _open(self, path):
+        self._close()
+        is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, "a", encoding="utf-8", newline="")
+        self._writer = csv.writer(self._file, lineterminator=os.linesep)
+        self.path = path
+        if is_new:
+            self._writer.writerow(self.HEADER)
+
+    def write_rows(self, rows, now=None):
+        """Anexa filas (código, fecha, hora) y las persiste antes de volver."""
+        now = now or datetime.now()
+        with self._lock:
+            path = self.path_for(now)
+            if self._file is None or path != self.path:
+                self._open(path)
+            with metrics.timer("csv_write"):
+                self._writer.writerows(rows)
+                self._file.flush()
+                os.fsync(self._file.fileno())
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._writer = None
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+# ------------------------------------------------------------
+# Registro de asistencia
+# ------------------------------------------------------------
+_attendance_write_lock = threading.Lock()
+
+def record_attendance(student_codes, attendance_today, csv_writer, username, grade, section):
+    """
+    Registra en la base de datos y en el CSV a los alumnos que todavía no
+    tienen asistencia hoy y devuelve la lista de códigos registrados. Lo usan
+    la ventana de asistencia y el procesamiento por lotes; el candado evita
+    registros duplicados cuando varios hilos registran a la vez.
+    """
+    with metrics.timer("register_attendance"):
+        registrados = _record_attendance(student_codes, attendance_today, csv_writer, username, grade, section)
+    metrics.count("students_registered", len(registrados))
+    return registrados
+
+def _record_attendance(student_codes, attendance_today, csv_writer, username, grade, section):
+    # Log del evento de asistencia
+    log_event(username, "Tomar asistencia", grade, section)
+
+    now = datetime.now()
+    fecha_str = now.strftime("%Y-%m-%d")
+    hora_str = now.strftime("%H:%M:%S")
+
+    filas_csv = []
+    registrados = []
+
+    with _attendance_write_lock:
+        # Todas las inserciones del lote se confirman en una sola transacción
+        with db.transaction():
+            for code in student_codes:
+                # Verificar nuevamente por si acaso
+                if code not in attendance_today:
+                    # Agregar al CSV
+                    filas_csv.append((code, fecha_str, hora_str))
+
+                    # Agregar a la base de datos
+                    result = db.fetchone("""
+                        SELECT grade, section FROM students WHERE student_code = ?
+                    """, (code,))
+
+                    if result:
+                        student_grade, student_section = result
+                        db.execute("""
+                            INSERT INTO attendance (student_code, name, grade, section, timestamp, date)
+                            VALUES (?, ?, ?, ?, ?, ?)
+                        """, (code, code, student_grade, student_section,
+                              now.strftime("%Y-%m-%d %H:%M:%S"), fecha_str))
+                        registrados.append(code)
+
+        # El CSV se escribe después del COMMIT: si la transacción se revierte
+        # no quedan filas en el CSV sin su registro en la base de datos
+        if filas_csv:
+            csv_writer.write_rows(filas_csv, now)
+
+        for code in registrados:
+            attendance_today.add(code)
+
+    return registrados
+
+# ------------------------------------------------------------
+# Ventana de diagnóstico de rendimiento
+# ------------------------------------------------------------
+class DiagnosticsWindow:
+    STAGES = ["decode", "face_locations", "face_encodings", "matching",
+              "check_attendance_today", "register_attendance", "csv_write"]
+
+    def __init__(self, master):
+        self.window = tk.Toplevel(master)
+        self.window.title("Diagnóstico de rendimiento")
+        self.window.geometry("640x360")
+        self.window.configure(bg='#ffffe0')
+
+        self.enabled = tk.BooleanVar(value=metrics.enabled)
+        tk.Checkbutton(self.window, text="Medir tiempos por etapa", variable=self.enabled, bg='#ffffe0',
+                       command=self._toggle).pack(pady=5)
+
+        self.text = tk.Text(self.window, height=14, width=80, font=("Courier", 9))
+        self.text.pack(padx=10)
+
+        botones = tk.Frame(self.window, bg='#ffffe0')
+        botones.pack(pady=5)
+        tk.Button(botones, text="Reiniciar", width=12, command=self._reset).pack(side=tk.LEFT, padx=5)
+        tk.Button(botones, text="Exportar ahora", width=12, command=metrics.export).pack(side=tk.LEFT, padx=5)
+
+        self._refresh()
+
+    def _toggle(self):
+        if self.enabled.get():
+            enable_metrics()
+        else:
+            metrics.disable()
+
+    def _reset(self):
+        metrics.reset()
+        self._refresh(reschedule=False)
+
+    def _refresh(self, reschedule=True):
+        if not self.window.winfo_exists():
+            return
+        snapshot = metrics.snapshot()
+        stages = snapshot["stages"]
+        lineas = [f"{'etapa':<24}{'veces':>8}{'media ms':>10}{'p50 ms':>9}{'p95 ms':>9}{'máx ms':>10}"]
+        for stage in self.STAGES + sorted(set(stages) - set(self.STAGES)):
+            row = stages.get(stage)
+            if row is None:
+                lineas.append(f"{stage:<24}{0:>8}")
+                continue
+            lineas.append(f"{stage:<24}{row['count']:>8}{row['mean_ms']:>10.2f}{row['p50_ms']:>9.2f}"
+                          f"{row['p95_ms']:>9.2f}{row['max_ms']:>10.2f}")
+        lineas.append("")
+        for name, value in sorted(snapshot["counters"].items()):
+            lineas.append(f"{name:<24}{value:>8}")
+        if not metrics.enabled:
+            lineas.append("Medición desactivada.")
+        self.text.delete("1.0", tk.END)
+        self.text.insert(tk.END, "\n".join(lineas))
+        if reschedule:
+            self.window.after(1000, self._refresh)
+
+# ------------------------------------------------------------
+# Ventana Tomar Asistencia (Versión Mejorada)
+# ------------------------------------------------------------
+class TakeAttendanceApp:
+    def __init__(self, master, username):
+        self.master = master
+        self.username = username
+
+        master.title("Tomar Asistencia - Reconocimiento Facial")
+        master.geometry("750x600")
+        self.create_menu()
+
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        icon_path = os.path.join(script_dir, "assets", "icon.ico")
+        bg_path = os.path.join(script_dir, "assets", "background_image.png")
+
+        try:
+            master.iconbitmap(icon_path)
+        except Exception:
+            pass
+
+        try:
+            self.bg_image = ImageTk.PhotoImage(file=bg_path)
+            bg_label = tk.Label(master, image=self.bg_image)
+            bg_label.place(x=0, y=0, relwidth=1, relheight=1)
+        except Exception:
+            pass
+
+        tk.Label(master, text=f"Usuario: {username}", font=("Helvetica", 14), bg='#ffffe0').pack(pady=20)
+
+        self.btn_upload = tk.Button(master, text="Subir Imagen o Video", width=25, command=self.upload_file)
+        self.btn_upload.pack(pady=5)
+
+        self.btn_take_photo = tk.Button(master, text="Tomar Foto (Asistencia)", width=25, command=self.take_photo)
+        self.btn_take_photo.pack(pady=5)
+
+        self.btn_record_video = tk.Button(master, text="Grabar Video (Asistencia)", width=25, command=self.record_video)
+        self.btn_record_video.pack(pady=5)
+
+        self.btn_export = tk.Button(master, text="Exportar Asistencia del Día", width=25, command=self.export_today_attendance)
+        self.btn_export.pack(pady=5)
+
+        self.full_gallery_fallback = tk.BooleanVar(value=False)
+        tk.Checkbutton(master, text="Buscar en toda la escuela si no se reconoce en el salón",
+                       variable=self.full_gallery_fallback, bg='#ffffe0',
+                       command=self._sync_options).pack(pady=5)
+
+        self.roster_mode = tk.BooleanVar(value=False)
+        tk.Checkbutton(master, text="Detener al reconocer a todo el salón",
+                       variable=self.roster_mode, bg='#ffffe0',
+                       command=self._sync_options).pack()
+
+        self.save_recording = tk.BooleanVar(value=False)
+        tk.Checkbutton(master, text="Guardar copia del video grabado (auditoría)",
+                       variable=self.save_recording, bg='#ffffe0').pack()
+
+        # Copias de las opciones que pueden leer los hilos de reconocimiento
+        # (las variables de Tk solo deben usarse desde el hilo principal)
+        self.use_full_gallery = False
+        self.use_roster_mode = False
+
+        self.status = tk.Label(master, text="", bg='#ffffe0')
+        self.status.pack(pady=(5, 0))
+
+        self.btn_cancel = tk.Button(master, text="Cancelar procesamiento", width=25, command=self.cancel_job)
+        self.btn_cancel.pack(pady=5)
+
+        self.text = tk.Text(master, height=10, width=90)
+        self.text.pack(pady=10)
+
+        # Los trabajos en segundo plano envían sus mensajes por esta cola
+        self.progress_queue = queue.Queue()
+        self.jobs = RecognitionJobRunner()
+        self.master.after(100, self._poll_progress)
+
+        self.dataset_dir = os.path.join(script_dir, "dataset")
+        if not os.path.exists(self.dataset_dir):
+            os.makedirs(self.dataset_dir)
+            self.post("Se creó la carpeta dataset. Por favor agregue fotos de referencia.\n")
+
+        self.grade, self.section = self.get_teacher_grade_section()
+        self.attendance_today = DailyAttendance()
+        self.csv_writer = AttendanceCsvWriter(script_dir)
+
+        self.engine = get_recognition_engine()
+        # Con --server se reconoce en el servicio local y no se carga la galería aquí
+        self.recognition_client = RecognitionClient(RECOGNITION_SERVER_URL) if RECOGNITION_SERVER_URL else None
+        self.load_known_faces()
+        self.recorded_video_path = None
+
+    def create_menu(self):
+        menubar = tk.Menu(self.master)
+        opciones = tk.Menu(menubar, tearoff=0)
+        opciones.add_command(label="Cerrar sesión", command=self._logout)
+        opciones.add_command(label="Volver", command=self._go_back_to_menu_docente)
+        opciones.add_command(label="Diagnóstico de rendimiento", command=lambda: DiagnosticsWindow(self.master))
+        menubar.add_cascade(label="Opciones", menu=opciones)
+        self.master.config(menu=menubar)
+
+    def _logout(self):
+        self.jobs.shutdown()
+        self.csv_writer.close()
+        self._stop_listening()
+        close_window(self.master)
+        run_login()
+
+    def _go_back_to_menu_docente(self):
+        self.jobs.shutdown()
+        self.csv_writer.close()
+        self._stop_listening()
+        close_window(self.master)
+        root = tk.Tk()
+        DocenteMenu(root, self.username)
+        root.mainloop()
+
+    def get_teacher_grade_section(self):
+        result = db.fetchone("SELECT assigned_grade, assigned_section FROM users WHERE username=?", (self.username,))
+        if result:
+            return result[0], result[1]
+        else:
+            return "", ""
+
+    def load_known_faces(self):
+        if self.recognition_client is not None:
+            self.post(f"Usando el servicio de reconocimiento en {self.recognition_client.url} "
+                      f"(en video y cámara los rostros se detectan en este equipo)\n")
+            return
+        try:
+            # El motor se carga una vez por proceso (si la precarga sigue en
+            # curso, load() espera a que termine en vez de codificar dos veces)
+            recomputed, removed = self.engine.load(on_message=self.post)
+
+            if recomputed or removed:
+                self.post(f"Caché de rostros actualizada: {recomputed} nuevos/modificados, {removed} eliminados.\n")
+            matcher = self.engine.matcher_for(self.grade, self.section)
+            if self.grade and self.section:
+                self.post(f"Cargados {len(matcher)} rostros conocidos (grado {self.grade}, sección {self.section}).\n")
+            else:
+                self.post(f"Cargados {len(matcher)} rostros conocidos.\n")
+
+            # Las fotos nuevas de dataset/ se incorporan sin reabrir la ventana
+            self.engine.add_listener(self._on_dataset_updated)
+            self.engine.start_watching()
+        except Exception as e:
+            self.post(f"Error al cargar rostros conocidos: {str(e)}\n")
+
+    def _on_dataset_updated(self, recomputed, removed):
+        self.post(f"dataset/ cambió: {recomputed} fotos nuevas/modificadas, {removed} eliminadas. Galería actualizada.\n")
+
+    def _stop_listening(self):
+        self.engine.remove_listener(self._on_dataset_updated)
+
+    def _sync_options(self):
+        self.use_full_gallery = self.full_gallery_fallback.get()
+        self.use_roster_mode = self.roster_mode.get()
+
+    def post(self, message):
+        """Muestra un mensaje en el área de texto; se puede llamar desde cualquier hilo."""
+        if threading.current_thread() is threading.main_thread():
+            self.text.insert(tk.END, message)
+            self.text.see(tk.END)
+        else:
+            self.progress_queue.put(("text", message))
+
+    def post_status(self, message):
+        self.progress_queue.put(("status", message))
+
+    def _poll_progress(self):
+        """Vuelca en la ventana los mensajes enviados por los trabajos en segundo plano."""
+        try:
+            while True:
+                kind, message = self.progress_queue.get_nowait()
+                if kind == "text":
+                    self.text.insert(tk.END, message)
+                    self.text.see(tk.END)
+                else:
+                    self.status.config(text=message)
+        except queue.Empty:
+            pass
+        if self.jobs.current is None and self.jobs.pending_count() == 0:
+            self.status.config(text="")
+        self.master.after(100, self._poll_progress)
+
+    def cancel_job(self):
+        job = self.jobs.cancel_current()
+        if job is not None:
+            self.post(f"Cancelando: {job.description}\n")
+
+    def submit_job(self, description, fn):
+        if self.jobs.current is not None or self.jobs.pending_count():
+            self.post(f"En cola: {description}\n")
+        return self.jobs.submit(description, fn)
+
+    def identify_faces(self, face_encodings):
+        """Reconoce los rostros contra la partición del grado/sección del docente."""
+        if self.recognition_client is not None:
+            return self.recognition_client.identify(face_encodings, self.grade, self.section,
+                                                    fallback=self.use_full_gallery)
+        return self.engine.identify(face_encodings, self.grade, self.section,
+                                    fallback=self.use_full_gallery)
+
+    def upload_file(self):
+        try:
+            file_path = filedialog.askopenfilename(filetypes=[("Archivos de imagen y video", "*.jpg *.png *.mp4 *.avi")])
+            if not file_path:
+                return
+                
+            ext = os.path.splitext(file_path)[1].lower()
+            name = os.path.basename(file_path)
+            if ext in [".jpg", ".png"]:
+                self.submit_job(name, lambda job: self.process_image(file_path, job))
+            elif ext in [".mp4", ".avi"]:
+                self.submit_job(name, lambda job: self.process_video(file_path, job))
+                self.recorded_video_path = file_path
+            else:
+                messagebox.showerror("Error", "Formato no soportado.")
+        except Exception as e:
+            self.post(f"Error al cargar archivo: {str(e)}\n")
+
+    def process_image(self, image_path, job=None):
+        try:
+            self.post(f"Procesando imagen: {image_path}\n")
+            self.post_status(f"Procesando {os.path.basename(image_path)}...")
+
+            if self.recognition_client is not None:
+                # La imagen completa se reconoce en el servicio
+                with open(image_path, "rb") as f:
+                    faces = self.recognition_client.recognize(f.read(), self.grade, self.section,
+                                                              fallback=self.use_full_gallery)
+                face_locations = [box for box, _ in faces]
+                codes = [code for _, code in faces]
+            else:
+                with metrics.timer("decode"):
+                    image = face_recognition.load_image_file(image_path)
+                face_locations, face_encodings = detect_and_encode(image)
+                codes = self.identify_faces(face_encodings) if face_locations else []
+
+            if not face_locations:
+                self.post("No se detectaron rostros en la imagen.\n")
+                return
+
+            presentes = set()
+            
+            for student_code in codes:
+                if student_code is None:
+                    continue
+
+                # Verificar si ya tiene asistencia hoy
+                if not self.check_attendance_today(student_code):
+                    presentes.add(student_code)
+                else:
+                    self.post(f"{student_code} ya tiene asistencia registrada hoy.\n")
+
+            if job is not None and job.cancelled.is_set():
+                self.post("Procesamiento cancelado.\n")
+            elif presentes:
+                self.register_attendance(presentes)
+                self.post(f"Asistencia registrada: {', '.join(presentes)}\n")
+            else:
+                self.post("No se reconocieron rostros nuevos para registrar asistencia.\n")
+                
+        except Exception as e:
+            self.post(f"Error al procesar imagen: {str(e)}\n")
+
+    def process_video(self, video_path, job=None):
+        try:
+            self.post("Procesando video...\n")
+
+            name = os.path.basename(video_path)
+            vistos = set()
+
+            def on_progress(stats, new_codes):
+                vistos.update(new_codes)
+                self.post_status(f"{name}: {stats['frames']} frames, {stats['faces']} rostros, "
+                                 f"{len(vistos)} alumnos reconocidos")
+                for code in sorted(new_codes):
+                    self.post(f"Reconocido: {code}\n")
+
+            roster = self.start_roster_progress()
+            pipeline = VideoRecognitionPipeline(self.identify_faces, roster=roster, on_progress=on_progress)
+            if job is not None:
+                job.attach(pipeline)
+            reconocidos, stats = pipeline.run(video_path)
+            if job is not None and job.cancelled.is_set():
+                self.post("Procesamiento cancelado; se registran los alumnos ya reconocidos.\n")
+            self.report_roster_progress(roster, stats["stop_reason"])
+            self.post(f"{stats['frames']} frames en {stats['seconds']:.1f} s ({stats['fps']:.1f} fps), "
+                      f"{stats['faces']} rostros detectados.\n")
+            self.post(f"Codificaciones: {stats['encodes']} "
+                      f"({stats['encodes_saved']} evitadas por el seguimiento de rostros).\n")
+            if stats["skipped_frames"]:
+                self.post(f"{stats['skipped_frames']} frames omitidos porque el video cambió de resolución.\n")
+
+            presentes = set()
+            for student_code in sorted(reconocidos):
+                # Verificar si ya tiene asistencia hoy
+                if not self.check_attendance_today(student_code):
+                    presentes.add(student_code)
+                else:
+                    self.post(f"{student_code} ya tiene asistencia registrada hoy.\n")
+
+            if presentes:
+                self.register_attendance(presentes)
+                self.post(f"Rostros detectados: {', '.join(presentes)}\n")
+            else:
+                self.post("No se reconocieron rostros nuevos para registrar asistencia.\n")
+
+        except Exception as e:
+            self.post(f"Error al procesar video: {str(e)}\n")
+
+    def start_roster_progress(self):
+        """
+        En modo "salón completo" devuelve un RosterProgress con los alumnos del
+        grado/sección del docente que todavía no tienen asistencia hoy.
+        """
+        if not (self.use_roster_mode and self.grade and self.section):
+            return None
+        roster = load_roster(self.grade, self.section)
+        if not roster:
+            self.post(f"No hay alumnos registrados en grado {self.grade}, sección {self.section}: "
+                      f"el modo salón completo no se aplica y se procesa todo el video.\n")
+            return None
+        expected = {code for code in roster if not self.check_attendance_today(code)}
+        if not expected:
+            self.post("Todos los alumnos del salón ya tienen asistencia hoy: el procesamiento "
+                      "no se detendrá por salón completo, solo por inactividad.\n")
+        else:
+            self.post(f"Faltan {len(expected)} alumnos por reconocer en el salón.\n")
+        return RosterProgress(expected)
+
+    def report_roster_progress(self, roster, stop_reason):
+        if roster is None:
+            return
+        if stop_reason == "complete":
+            self.post("Todo el salón fue reconocido; se detuvo el procesamiento.\n")
+        elif stop_reason == "idle":
+            self.post(f"Sin alumnos nuevos en {roster.idle_timeout} s; se detuvo el procesamiento.\n")
+        if roster.missing:
+            self.post(f"No reconocidos: {', '.join(sorted(roster.missing))}\n")
+
+    def check_attendance_today(self, student_code):
+        """Verifica si el estudiante ya tiene asistencia registrada hoy"""
+        with metrics.timer("check_attendance_today"):
+            return student_code in self.attendance_today
+
+    def take_photo(self):
+        capture = None
+        live = None
+        try:
+            capture = CameraCapture(0)
+            if not capture.is_opened():
+                self.post("Error: No se pudo abrir la cámara.\n")
+                return
+
+            capture.start()
+            live = LiveRecognizer(capture, self.identify_faces)
+            live.start()
+
+            self.post(f"Reconocimiento en vivo: se registra a cada alumno reconocido en {LIVE_CONFIRM_FRAMES} "
+                      f"frames seguidos. Presiona 's' para tomar foto o 'q' para salir.\n")
+            self.master.update()
+
+            last_id = 0
+            while True:
+                if capture.failed:
+                    self.post("Error al capturar frame de la cámara.\n")
+                    break
+
+                frame_id, frame = capture.latest()
+                if frame is not None and frame_id != last_id:
+                    last_id = frame_id
+                    preview = draw_recognitions(frame.copy(), live.results())
+                    cv2.imshow("Tomar Foto - Presiona 'q' para salir", preview)
+                key = cv2.waitKey(1) & 0xFF
+
+                # Alumnos confirmados por el reconocimiento en vivo
+                self.register_live_confirmations(live)
+
+                if key == ord('q'):
+                    self.post("Grabación finalizada por el usuario.\n")
+                    break
+
+                # Tomar foto cuando se presiona 's': se reconoce el frame en memoria
+                if key == ord('s') and frame is not None:
+                    self.recognize_snapshot(frame)
+
+        except Exception as e:
+            self.post(f"Error en la captura de foto: {str(e)}\n")
+        finally:
+            if live is not None:
+                live.stop()
+                self.register_live_confirmations(live)
+            if capture is not None:
+                capture.stop()
             cv2.destroyAllWindows()
 
+    def register_live_confirmations(self, live):
+        confirmados = set()
+        while True:
+            try:
+                confirmados.add(live.confirmed.get_nowait())
+            except queue.Empty:
+                break
+        presentes = {code for code in confirmados if not self.check_attendance_today(code)}
+        if presentes:
+            self.register_attendance(presentes)
+            self.post(f"Asistencia registrada (en vivo): {', '.join(sorted(presentes))}\n")
+
+    def recognize_snapshot(self, frame):
+        """Reconoce un frame BGR de la cámara sin pasar por un archivo temporal."""
+        try:
+            image = np.ascontiguousarray(frame[:, :, ::-1])
+            face_locations, face_encodings = detect_and_encode(image)
+
+            if not face_locations:
+                self.post("No se detectaron rostros en la foto.\n")
+                return
+
+            presentes = set()
+
+            for student_code in self.identify_faces(face_encodings):
+                if student_code is None:
+                    continue
+
+                # Verificar si ya tiene asistencia hoy
+                if not self.check_attendance_today(student_code):
+                    presentes.add(student_code)
+                else:
+                    self.post(f"{student_code} ya tiene asistencia registrada hoy.\n")
+
+            if presentes:
+                self.register_attendance(presentes)
+                self.post(f"Rostros detectados: {', '.join(presentes)}\n")
+            else:
+                self.post("No se reconocieron rostros nuevos para registrar asistencia.\n")
+
+        except Exception as e:
+            self.post(f"Error al procesar foto: {str(e)}\n")
+
     def record_video(self):
         cap = None
         video_writer = None
+        recognizer = None
         try:
-            script_dir = os.path.dirname(os.path.abspath(__file__))
-            temp_video_path = os.path.join(script_dir, "temp_record.avi")
-
             cap = cv2.VideoCapture(0)
             if not cap.isOpened():
                 messagebox.showerror("Error", "No se pudo abrir la cámara para grabar.")
                 return
 
-            # Obtener dimensiones del frame
-            frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-            frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-            
-            fourcc = cv2.VideoWriter_fourcc(*'XVID')
-            video_writer = cv2.VideoWriter(temp_video_path, fourcc, 20.0, (frame_width, frame_height))
+            # La copia en AVI solo se escribe si se pidió para auditoría
+            temp_video_path = None
+            if self.save_recording.get():
+                script_dir = os.path.dirname(os.path.abspath(__file__))
+                temp_video_path = os.path.join(script_dir, "temp_record.avi")
+
+                # Obtener dimensiones del frame
+                frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+                frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+                fourcc = cv2.VideoWriter_fourcc(*'XVID')
+                video_writer = cv2.VideoWriter(temp_video_path, fourcc, 20.0, (frame_width, frame_height))
 
-            self.text.insert(tk.END, "Grabando video... Presiona 'q' para detener.\n")
+            self.post("Grabando video... Presiona 'q' para detener.\n")
             self.master.update()
 
             recording_start = datetime.now()
             max_recording_seconds = 30  # Límite de 30 segundos
 
+            # Los frames se reconocen mientras se graba; en modo "salón
+            # completo" además se corta la grabación en cuanto no falte nadie.
+            roster = self.start_roster_progress()
+            recognizer = StreamingRecognizer(VideoRecognitionPipeline(self.identify_faces, workers=0))
+            stop_reason = None
+            frame_count = 0
+
             while True:
                 ret, frame = cap.read()
                 if not ret:
-                    self.text.insert(tk.END, "Error al capturar frame.\n")
+                    self.post("Error al capturar frame.\n")
                     break
 
                 # Mostrar tiempo de grabación
                 elapsed = (datetime.now() - recording_start).total_seconds()
                 if elapsed > max_recording_seconds:
-                    self.text.insert(tk.END, f"Límite de {max_recording_seconds} segundos alcanzado.\n")
+                    self.post(f"Límite de {max_recording_seconds} segundos alcanzado.\n")
                     break
 
+                frame_count += 1
+                if frame_count % VIDEO_SAMPLE_EVERY_N_FRAMES == 0:
+                    recognizer.feed(frame.copy())
+                if roster is not None:
+                    roster.add(recognizer.recognized(), elapsed)
+                    stop_reason = roster.stop_reason(elapsed)
+
                 cv2.putText(frame, f"Grabando: {int(elapsed)}s", (10, 30), 
                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
                 cv2.imshow('Grabando Video - Presiona q para detener', frame)
-                video_writer.write(frame)
+                if video_writer is not None:
+                    video_writer.write(frame)
 
+                if stop_reason:
+                    break
                 if cv2.waitKey(1) & 0xFF == ord('q'):
-                    self.text.insert(tk.END, "Grabación finalizada por el usuario.\n")
+                    self.post("Grabación finalizada por el usuario.\n")
                     break
 
-            video_writer.release()
-            self.recorded_video_path = temp_video_path
-            
-            # Procesar el video grabado
-            self.process_video(temp_video_path)
+            if video_writer is not None:
+                video_writer.release()
+                self.recorded_video_path = temp_video_path
+                self.post(f"Copia del video guardada en {temp_video_path}\n")
+
+            reconocidos, _ = recognizer.finish()
+            recognizer = None
+            if roster is not None:
+                roster.add(reconocidos, (datetime.now() - recording_start).total_seconds())
+            self.report_roster_progress(roster, stop_reason)
+            presentes = {code for code in reconocidos if not self.check_attendance_today(code)}
+            if presentes:
+                self.register_attendance(presentes)
+                self.post(f"Rostros detectados: {', '.join(sorted(presentes))}\n")
+            else:
+                self.post("No se reconocieron rostros nuevos para registrar asistencia.\n")
             
         except Exception as e:
-            self.text.insert(tk.END, f"Error en la grabación de video: {str(e)}\n")
+            self.post(f"Error en la grabación de video: {str(e)}\n")
         finally:
+            if recognizer is not None:
+                recognizer.finish()
             if video_writer is not None:
                 video_writer.release()
             if cap is not None and cap.isOpened():
@@ -828,52 +3779,10 @@ class TakeAttendanceApp:
 
     def register_attendance(self, student_codes):
         try:
-            # Log del evento de asistencia
-            log_event(self.username, "Tomar asistencia", self.grade, self.section)
-
-            now = datetime.now()
-            fecha_str = now.strftime("%Y-%m-%d")
-            hora_str = now.strftime("%H:%M:%S")
-
-            script_dir = os.path.dirname(os.path.abspath(__file__))
-            csv_path = os.path.join(script_dir, "attendance_records.csv")
-            
-            # Verificar si el archivo existe, si no, crear uno nuevo
-            if not os.path.exists(csv_path):
-                df = pd.DataFrame(columns=["Código", "Fecha", "Hora"])
-                df.to_csv(csv_path, index=False)
-            else:
-                df = pd.read_csv(csv_path)
-
-            conn = sqlite3.connect("database/attendance.db")
-            cursor = conn.cursor()
-            
-            for code in student_codes:
-                # Verificar nuevamente por si acaso
-                if not self.check_attendance_today(code):
-                    # Agregar al CSV
-                    df.loc[len(df)] = {"Código": code, "Fecha": fecha_str, "Hora": hora_str}
-                    
-                    # Agregar a la base de datos
-                    cursor.execute("""
-                        SELECT grade, section FROM students WHERE student_code = ?
-                    """, (code,))
-                    result = cursor.fetchone()
-                    
-                    if result:
-                        grade, section = result
-                        cursor.execute("""
-                            INSERT INTO attendance (student_code, name, grade, section, timestamp)
-                            VALUES (?, ?, ?, ?, ?)
-                        """, (code, code, grade, section, now.strftime("%Y-%m-%d %H:%M:%S")))
-            
-            # Guardar cambios
-            df.to_csv(csv_path, index=False)
-            conn.commit()
-            conn.close()
-            
+            record_attendance(student_codes, self.attendance_today, self.csv_writer,
+                              self.username, self.grade, self.section)
         except Exception as e:
-            self.text.insert(tk.END, f"Error al registrar asistencia: {str(e)}\n")
+            self.post(f"Error al registrar asistencia: {str(e)}\n")
 
     def export_today_attendance(self):
         try:
@@ -895,23 +3804,19 @@ class TakeAttendanceApp:
             export_path = os.path.join(exports_dir, filename)
 
             # Consulta SQL para obtener solo la asistencia del día actual
-            conn = sqlite3.connect("database/attendance.db")
             query = """
                 SELECT student_code as Código, 
                        grade as Grado, 
                        section as Sección, 
                        strftime('%H:%M:%S', timestamp) as Hora
                 FROM attendance
-                WHERE date(timestamp) = ?
+                WHERE date = ?
                   AND grade = ?
                   AND section = ?
                 ORDER BY timestamp
             """
             
-            cursor = conn.cursor()
-            cursor.execute(query, (fecha_str, self.grade, self.section))
-            records = cursor.fetchall()
-            conn.close()
+            records = db.fetchall(query, (fecha_str, self.grade, self.section))
 
             if not records:
                 messagebox.showinfo("Info", "No hay registros de asistencia para el día de hoy.")
@@ -926,8 +3831,500 @@ class TakeAttendanceApp:
         except Exception as e:
             messagebox.showerror("Error", f"No se pudo exportar la asistencia: {str(e)}")
 
+# ------------------------------------------------------------
+# Procesamiento por lotes sin interfaz
+# ------------------------------------------------------------
+BATCH_IMAGE_EXTENSIONS = (".jpg", ".png")
+BATCH_VIDEO_EXTENSIONS = (".mp4", ".avi")
+
+def _encode_image_file(image_path, detection_scale):
+    """Se ejecuta en un proceso trabajador: devuelve las codificaciones de una imagen."""
+    image = face_recognition.load_image_file(image_path)
+    _, face_encodings = detect_and_encode(image, detection_scale)
+    return face_encodings
+
+def load_batch_manifest(source):
+    """
+    Devuelve [(ruta, grado, sección)]. source puede ser un manifiesto CSV con
+    columnas path,grade,section (rutas relativas al manifiesto) o una carpeta
+    organizada como GRADO/SECCIÓN/archivo; los archivos fuera de esa
+    estructura se comparan contra la galería completa.
+    """
+    media = BATCH_IMAGE_EXTENSIONS + BATCH_VIDEO_EXTENSIONS
+    items = []
+    if os.path.isfile(source):
+        base_dir = os.path.dirname(os.path.abspath(source))
+        with open(source, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                path = os.path.join(base_dir, row["path"])
+                items.append((path, row.get("grade") or None, row.get("section") or None))
+        return items
+
+    for dirpath, _, filenames in os.walk(source):
+        parts = os.path.relpath(dirpath, source).split(os.sep)
+        grade, section = (parts[0], parts[1]) if len(parts) == 2 else (None, None)
+        for filename in sorted(filenames):
+            if filename.lower().endswith(media):
+                items.append((os.path.join(dirpath, filename), grade, section))
+    return sorted(items)
+
+class BatchAttendanceProcessor:
+    """
+    Procesa muchos archivos de varios salones con una sola galería cargada.
+    Hasta 'workers' archivos avanzan a la vez, y la detección y codificación
+    se reparten en un único ProcessPoolExecutor compartido por todos: las
+    imágenes se codifican en un trabajador y los videos usan
+    VideoRecognitionPipeline sobre ese mismo grupo. La asistencia se registra
+    con record_attendance, igual que en la ventana de asistencia.
+    """
+    def __init__(self, gallery, attendance_today, csv_writer, username, workers=VIDEO_PIPELINE_WORKERS,
+                 detection_scale=DETECTION_SCALE, fallback=False, on_result=None):
+        self.gallery = gallery
+        self.attendance_today = attendance_today
+        self.csv_writer = csv_writer
+        self.username = username
+        self.workers = max(1, workers)
+        self.detection_scale = detection_scale
+        self.fallback = fallback
+        self.on_result = on_result
+
+    def _process(self, pool, path, grade, section):
+        result = {"path": path, "grade": grade, "section": section, "frames": 0,
+                  "faces": 0, "recognized": [], "registered": [], "error": None}
+        start = time.perf_counter()
+        try:
+            identify = lambda encs: self.gallery.identify(encs, grade, section, fallback=self.fallback)
+            if path.lower().endswith(BATCH_VIDEO_EXTENSIONS):
+                pipeline = VideoRecognitionPipeline(identify, workers=self.workers,
+                                                    detection_scale=self.detection_scale, pool=pool)
+                presentes, stats = pipeline.run(path)
+                result["frames"] = stats["frames"]
+                result["faces"] = stats["faces"]
+            else:
+                face_encodings = pool.submit(_encode_image_file, path, self.detection_scale).result()
+                presentes = {code for code in identify(face_encodings) if code is not None} if face_encodings else set()
+                result["frames"] = 1
+                result["faces"] = len(face_encodings)
+            result["recognized"] = sorted(presentes)
+            nuevos = {code for code in presentes if code not in self.attendance_today}
+            if nuevos:
+                result["registered"] = sorted(record_attendance(nuevos, self.attendance_today, self.csv_writer,
+                                                                self.username, grade, section))
+        except Exception as e:
+            result["error"] = str(e)
+        result["seconds"] = time.perf_counter() - start
+        if self.on_result is not None:
+            self.on_result(result)
+        return result
+
+    def run(self, items):
+        """Procesa [(ruta, grado, sección)] y devuelve (resultados, resumen)."""
+        start = time.perf_counter()
+        if os.name == "posix":
+            # Los trabajadores deben heredar el resource_tracker del proceso principal
+            # para que la memoria compartida de los videos se libere una sola vez.
+            resource_tracker.ensure_running()
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="batch") as files:
+                futures = [files.submit(self._process, pool, path, grade, section)
+                           for path, grade, section in items]
+                results = [future.result() for future in futures]
+        seconds = time.perf_counter() - start
+
+        summary = {
+            "files": len(results),
+            "images": sum(1 for r in results if not r["path"].lower().endswith(BATCH_VIDEO_EXTENSIONS)),
+            "videos": sum(1 for r in results if r["path"].lower().endswith(BATCH_VIDEO_EXTENSIONS)),
+            "errors": sum(1 for r in results if r["error"]),
+            "frames": sum(r["frames"] for r in results),
+            "faces": sum(r["faces"] for r in results),
+            "recognized": len({code for r in results for code in r["recognized"]}),
+            "registered": sum(len(r["registered"]) for r in results),
+            "workers": self.workers,
+            "seconds": seconds,
+        }
+        summary["files_per_second"] = summary["files"] / seconds if seconds else 0.0
+        summary["frames_per_second"] = summary["frames"] / seconds if seconds else 0.0
+        return results, summary
+
+def run_batch(source, workers=VIDEO_PIPELINE_WORKERS, username="lote", fallback=False):
+    """Punto de entrada del subcomando 'batch': no necesita pantalla."""
+    create_logs_table()
+    migrate_attendance_date_column()
+
+    items = load_batch_manifest(source)
+    if not items:
+        print(f"No se encontraron imágenes ni videos en {source}")
+        return None
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    engine = get_recognition_engine()
+    engine.load(on_message=lambda msg: print(msg, end=""))
+    gallery = engine.gallery
+    csv_writer = AttendanceCsvWriter(script_dir)
+
+    def on_result(result):
+        name = os.path.basename(result["path"])
+        if result["error"]:
+            print(f"{name}: error: {result['error']}")
+        else:
+            registrados = ", ".join(result["registered"]) or "ninguno nuevo"
+            print(f"{name} ({result['grade'] or '-'}/{result['section'] or '-'}): "
+                  f"{len(result['recognized'])} reconocidos, registrados: {registrados} "
+                  f"[{result['seconds']:.1f} s]")
+
+    processor = BatchAttendanceProcessor(gallery, DailyAttendance(), csv_writer, username,
+                                         workers=workers, fallback=fallback, on_result=on_result)
+    try:
+        _, summary = processor.run(items)
+    finally:
+        csv_writer.close()
+        audit_logger.flush()
+
+    print(f"Archivos: {summary['files']} ({summary['images']} imágenes, {summary['videos']} videos), "
+          f"errores: {summary['errors']}")
+    print(f"Frames: {summary['frames']}, rostros: {summary['faces']}, alumnos reconocidos: {summary['recognized']}, "
+          f"asistencias registradas: {summary['registered']}")
+    print(f"Tiempo: {summary['seconds']:.1f} s con {summary['workers']} trabajadores -> "
+          f"{summary['files_per_second']:.2f} archivos/s, {summary['frames_per_second']:.1f} frames/s")
+    return summary
+
+# ------------------------------------------------------------
+# Servicio de reconocimiento local (varias terminales)
+# ------------------------------------------------------------
+RECOGNITION_SERVER_HOST = "127.0.0.1"
+RECOGNITION_SERVER_PORT = 8765
+RECOGNITION_BATCH_WINDOW_MS = 20  # Espera máxima para juntar pedidos de varios clientes
+RECOGNITION_BATCH_MAX = 32        # Pedidos por lote como máximo
+RECOGNITION_CLIENT_TIMEOUT = 30
+RECOGNITION_SERVER_URL = None     # Si se indica (--server), la ventana de asistencia reconoce en el servicio
+
+def _recognize_image_bytes(image_bytes, detection_scale):
+    """Se ejecuta en un proceso trabajador: detecta y codifica los rostros de una imagen."""
+    image = face_recognition.load_image_file(io.BytesIO(image_bytes))
+    face_locations, face_encodings = detect_and_encode(image, detection_scale)
+    return face_locations, [np.asarray(e, dtype=np.float32) for e in face_encodings]
+
+class RecognitionBatcher:
+    """
+    Junta los pedidos que llegan de todos los clientes durante una ventana
+    corta (o hasta batch_max) y los atiende como un lote: las imágenes se
+    detectan y codifican a la vez en el grupo de procesos, y luego todos los
+    rostros del lote de cada grado/sección se comparan con una sola llamada
+    a la galería. Cada pedido recibe su resultado por un Future.
+    gallery puede ser una FaceGallery o el RecognitionEngine (mismo identify).
+    """
+    def __init__(self, gallery, workers=VIDEO_PIPELINE_WORKERS, batch_window_ms=RECOGNITION_BATCH_WINDOW_MS,
+                 batch_max=RECOGNITION_BATCH_MAX, detection_scale=DETECTION_SCALE):
+        self.gallery = gallery
+        self.batch_window = batch_window_ms / 1000.0
+        self.batch_max = batch_max
+        self.detection_scale = detection_scale
+        self.stats = {"requests": 0, "batches": 0, "faces": 0, "errors": 0}
+        self._stats_lock = threading.Lock()  # /stats se lee desde los hilos del servidor HTTP
+        self._requests = queue.Queue()
+        self._pool = ProcessPoolExecutor(max_workers=max(1, workers))
+        self._thread = threading.Thread(target=self._run, name="recognition-batcher", daemon=True)
+        self._thread.start()
+
+    def submit_image(self, image_bytes, grade=None, section=None, fallback=False):
+        """Future con [(caja, código o None)] de los rostros de la imagen."""
+        return self._submit("image", image_bytes, grade, section, fallback)
+
+    def submit_encodings(self, encodings, grade=None, section=None, fallback=False):
+        """Future con la lista de códigos (o None) de las codificaciones dadas."""
+        return self._submit("encodings", encodings, grade, section, fallback)
+
+    def _submit(self, kind, payload, grade, section, fallback):
+        future = Future()
+        self._requests.put((kind, payload, grade, section, fallback, future))
+        return future
+
+    def snapshot_stats(self):
+        with self._stats_lock:
+            return dict(self.stats)
+
+    def _count(self, **increments):
+        with self._stats_lock:
+            for key, value in increments.items():
+                self.stats[key] += value
+
+    def _collect(self):
+        """Devuelve (lote, cerrando). close() encola None: el lote ya reunido se atiende igual."""
+        item = self._requests.get()
+        if item is None:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.batch_max:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        closing = False
+        while not closing:
+            batch, closing = self._collect()
+            if not batch:
+                continue
+            try:
+                self._process(batch)
+            except Exception as e:
+                for *_, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _process(self, batch):
+        self._count(batches=1, requests=len(batch))
+
+        # Detección y codificación de todas las imágenes del lote en paralelo
+        detections = {}
+        for i, (kind, payload, *_rest) in enumerate(batch):
+            if kind == "image":
+                detections[i] = self._pool.submit(_recognize_image_bytes, payload, self.detection_scale)
+
+        pending = []  # (índice del pedido, cajas, codificaciones)
+        for i, (kind, payload, *_rest) in enumerate(batch):
+            future = batch[i][-1]
+            if kind == "image":
+                try:
+                    boxes, encodings = detections[i].result()
+                except Exception as e:
+                    self._count(errors=1)
+                    future.set_exception(e)
+                    continue
+                pending.append((i, boxes, encodings))
+            else:
+                pending.append((i, None, list(payload)))
+
+        # Una comparación por grado/sección con los rostros de todos los pedidos
+        groups = {}
+        for item in pending:
+            _, _, grade, section, fallback, _ = batch[item[0]]
+            groups.setdefault((grade, section, fallback), []).append(item)
+        for (grade, section, fallback), items in groups.items():
+            encodings = [e for _, _, encs in items for e in encs]
+            self._count(faces=len(encodings))
+            codes = self.gallery.identify(encodings, grade, section, fallback=fallback) if encodings else []
+            offset = 0
+            for i, boxes, encs in items:
+                item_codes = codes[offset:offset + len(encs)]
+                offset += len(encs)
+                future = batch[i][-1]
+                future.set_result(item_codes if boxes is None else list(zip(boxes, item_codes)))
+
+    def close(self):
+        self._requests.put(None)
+        self._thread.join()
+        self._pool.shutdown()
+
+class RecognitionRequestHandler(BaseHTTPRequestHandler):
+    """
+    POST /recognize?grade=&section=&fallback=1  cuerpo: imagen JPG/PNG
+    POST /identify?grade=&section=&fallback=1   cuerpo: JSON {"encodings": [[128 floats], ...]}
+    GET  /stats
+    """
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if urlparse(self.path).path == "/stats":
+            self._send_json(200, self.server.batcher.snapshot_stats())
+        else:
+            self._send_json(404, {"error": "Ruta no encontrada"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        grade = params.get("grade", [None])[0] or None
+        section = params.get("section", [None])[0] or None
+        fallback = params.get("fallback", ["0"])[0] == "1"
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        batcher = self.server.batcher
+        try:
+            if url.path == "/recognize":
+                faces = batcher.submit_image(body, grade, section, fallback).result()
+                self._send_json(200, {"faces": [{"box": [int(v) for v in box], "code": code} for box, code in faces]})
+            elif url.path == "/identify":
+                encodings = [np.asarray(e, dtype=np.float32) for e in json.loads(body)["encodings"]]
+                self._send_json(200, {"codes": batcher.submit_encodings(encodings, grade, section, fallback).result()})
+            else:
+                self._send_json(404, {"error": "Ruta no encontrada"})
+        except Exception as e:
+            self._send_json(500, {"error": str(e)})
+
+    def log_message(self, format, *args):
+        pass
+
+class RecognitionServer(ThreadingHTTPServer):
+    """Servidor HTTP local que comparte una sola galería entre todas las terminales."""
+    daemon_threads = True
+
+    def __init__(self, batcher, host=RECOGNITION_SERVER_HOST, port=RECOGNITION_SERVER_PORT):
+        super().__init__((host, port), RecognitionRequestHandler)
+        self.batcher = batcher
+
+class RecognitionClient:
+    """Cliente del servicio de reconocimiento; misma interfaz de grado/sección que FaceGallery."""
+    def __init__(self, url, timeout=RECOGNITION_CLIENT_TIMEOUT):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def _post(self, path, body, content_type, grade, section, fallback):
+        query = urlencode({"grade": grade or "", "section": section or "", "fallback": "1" if fallback else "0"})
+        request = urllib.request.Request(f"{self.url}{path}?{query}", data=body, method="POST",
+                                         headers={"Content-Type": content_type})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    def recognize(self, image_bytes, grade=None, section=None, fallback=False):
+        """Devuelve [(caja, código o None)] de los rostros de la imagen."""
+        result = self._post("/recognize", image_bytes, "application/octet-stream", grade, section, fallback)
+        return [(tuple(face["box"]), face["code"]) for face in result["faces"]]
+
+    def identify(self, face_encodings, grade=None, section=None, fallback=False):
+        body = json.dumps({"encodings": [np.asarray(e, dtype=float).tolist() for e in face_encodings]})
+        return self._post("/identify", body.encode("utf-8"), "application/json", grade, section, fallback)["codes"]
+
+    def stats(self):
+        with urllib.request.urlopen(f"{self.url}/stats", timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+def run_server(host=RECOGNITION_SERVER_HOST, port=RECOGNITION_SERVER_PORT, workers=VIDEO_PIPELINE_WORKERS,
+               batch_window_ms=RECOGNITION_BATCH_WINDOW_MS):
+    """Punto de entrada del subcomando 'serve'."""
+    engine = get_recognition_engine()
+    engine.load(on_message=lambda msg: print(msg, end=""))
+    if os.name == "posix":
+        # El resource_tracker debe existir antes de crear los procesos trabajadores
+        resource_tracker.ensure_running()
+    engine.start_watching()
+    batcher = RecognitionBatcher(engine, workers=workers, batch_window_ms=batch_window_ms)
+    server = RecognitionServer(batcher, host, port)
+    print(f"Servicio de reconocimiento en http://{host}:{server.server_address[1]} "
+          f"({len(engine.names)} rostros de dataset/, {workers} trabajadores)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        batcher.close()
+
 # ------------------------------------------------------------
 # Ejecución principal
 # ------------------------------------------------------------
+def main(argv=None):
+    global GALLERY_STORE_DIR, RECOGNITION_SERVER_URL, SEARCH_BACKEND
+    parser = argparse.ArgumentParser(description="Sistema de asistencia con reconocimiento facial")
+    parser.add_argument("--metrics", action="store_true",
+                        help=f"Medir tiempos por etapa y exportarlos a {METRICS_LOG_FILENAME}")
+    parser.add_argument("--server", default=None,
+                        help="URL del servicio de reconocimiento (p. ej. http://127.0.0.1:8765) en lugar de reconocer "
+                             "aquí. Las fotos subidas se envían enteras al servicio; en video, cámara en vivo y "
+                             "grabación la detección y codificación siguen en este equipo y solo la comparación "
+                             "con la galería se hace en el servicio")
+    parser.add_argument("--gallery-store", default=None,
+                        help="Carpeta con la galería completa cuantizada (ver build-gallery-store)")
+    parser.add_argument("--search-backend", choices=SEARCH_BACKENDS, default=SEARCH_BACKEND,
+                        help=f"Búsqueda de rostros: exacta, índice IVF, o auto (IVF desde {SEARCH_INDEX_MIN_SIZE} rostros)")
+    subparsers = parser.add_subparsers(dest="command")
+
+    backfill = subparsers.add_parser(
+        "backfill-encodings",
+        help="Codifica una sola vez las fotos de los alumnos ya registrados y las guarda en students.dataset")
+    backfill.add_argument("--workers", type=int, default=None, help="Procesos en paralelo (por defecto, uno por núcleo)")
+
+    store = subparsers.add_parser(
+        "build-gallery-store",
+        help="Guarda la galería completa cuantizada en una carpeta para galerías muy grandes")
+    store.add_argument("directory", help="Carpeta de destino")
+    store.add_argument("--format", choices=QUANTIZED_FORMATS, default="int8")
+
+    batch = subparsers.add_parser(
+        "batch",
+        help="Procesa sin interfaz las fotos y videos de varios salones y registra la asistencia")
+    batch.add_argument("source", help="Carpeta con subcarpetas GRADO/SECCIÓN o manifiesto CSV (path,grade,section)")
+    batch.add_argument("--workers", type=int, default=VIDEO_PIPELINE_WORKERS,
+                       help="Archivos y procesos trabajadores en paralelo")
+    batch.add_argument("--username", default="lote", help="Usuario que figura en el log de eventos")
+    batch.add_argument("--full-gallery-fallback", action="store_true",
+                       help="Buscar en toda la escuela los rostros que no se reconocen en el salón")
+
+    serve = subparsers.add_parser(
+        "serve", help="Servicio local de reconocimiento compartido por varias terminales")
+    serve.add_argument("--host", default=RECOGNITION_SERVER_HOST)
+    serve.add_argument("--port", type=int, default=RECOGNITION_SERVER_PORT)
+    serve.add_argument("--workers", type=int, default=VIDEO_PIPELINE_WORKERS, help="Procesos trabajadores")
+    serve.add_argument("--batch-window-ms", type=int, default=RECOGNITION_BATCH_WINDOW_MS,
+                       help="Espera máxima para juntar pedidos en un lote")
+
+    multicam = subparsers.add_parser(
+        "multicam", help="Reconoce varias cámaras, archivos o URL a la vez y registra la asistencia")
+    multicam.add_argument("sources", nargs="+", help="Índices de cámara (0, 1...), archivos de video o URL rtsp://")
+    multicam.add_argument("--workers", type=int, default=VIDEO_PIPELINE_WORKERS,
+                          help="Procesos trabajadores compartidos por todas las fuentes")
+    multicam.add_argument("--grade", default=None, help="Grado del salón (por defecto, toda la escuela)")
+    multicam.add_argument("--section", default=None, help="Sección del salón")
+    multicam.add_argument("--duration", type=float, default=None, help="Segundos a procesar (por defecto, hasta el final)")
+    multicam.add_argument("--username", default="multicámara", help="Usuario que figura en el log de eventos")
+    multicam.add_argument("--full-gallery-fallback", action="store_true",
+                          help="Buscar en toda la escuela los rostros que no se reconocen en el salón")
+
+    args = parser.parse_args(argv)
+    if args.metrics or METRICS_ENABLED:
+        enable_metrics()
+    GALLERY_STORE_DIR = args.gallery_store
+    SEARCH_BACKEND = args.search_backend
+
+    if args.command == "backfill-encodings":
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        updated, failed, missing = backfill_student_encodings(os.path.join(script_dir, "dataset"), workers=args.workers)
+        print(f"Codificaciones guardadas: {updated}")
+        for code, error in failed:
+            print(f"  {code}: {error}")
+        if missing:
+            print(f"Sin foto disponible: {', '.join(missing)}")
+        return
+
+    if args.command == "build-gallery-store":
+        engine = get_recognition_engine()
+        engine.load(on_message=lambda msg: print(msg, end=""))
+        store = build_gallery_store(args.directory, engine.names, engine.encodings, fmt=args.format)
+        sizes = store.nbytes()
+        print(f"Galería guardada en {args.directory}: {len(store)} rostros ({store.format}), "
+              f"búsqueda gruesa {sizes['coarse'] / 1024:.1f} KB, re-ranking float32 {sizes['exact'] / 1024:.1f} KB")
+        return
+
+    if args.command == "batch":
+        run_batch(args.source, workers=args.workers, username=args.username,
+                  fallback=args.full_gallery_fallback)
+        return
+
+    if args.command == "multicam":
+        run_multicam(args.sources, workers=args.workers, grade=args.grade, section=args.section,
+                     duration=args.duration, username=args.username, fallback=args.full_gallery_fallback)
+        return
+
+    if args.command == "serve":
+        run_server(args.host, args.port, workers=args.workers, batch_window_ms=args.batch_window_ms)
+        return
+
+    RECOGNITION_SERVER_URL = args.server
+    run_login()
+
 if __name__ == "__main__":
-    run_login()
\ No newline at end of file
+    main()
\ No newline at end of file
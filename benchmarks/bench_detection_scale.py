@@ -0,0 +1,86 @@
+"""
+Velocidad frente a recall de la detección en resolución reducida.
+
+Cada imagen de dataset/ se amplía y se coloca sobre un lienzo grande (por
+defecto 1920x1080, como un frame de video) y se procesa con detect_and_encode
+a distintas escalas de detección. Se mide el tiempo medio por imagen y el
+recall: la fracción de alumnos que se siguen reconociendo correctamente contra
+la galería calculada a resolución completa.
+
+Uso:
+    python benchmarks/bench_detection_scale.py [--canvas 1920x1080] [--face-zoom 1.5]
+"""
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+from attendance_app import FaceEncodingCache, FaceMatcher, detect_and_encode, resolve_detection_scale
+
+DATASET_DIR = os.path.join(ROOT_DIR, "dataset")
+DEFAULT_SCALES = (1.0, 0.75, 0.5, 0.25, "auto")
+
+
+def make_scenes(canvas_size, face_zoom):
+    """Devuelve [(código, imagen RGB)] con cada foto de referencia sobre un lienzo."""
+    width, height = canvas_size
+    scenes = []
+    for filename in sorted(os.listdir(DATASET_DIR)):
+        if not filename.lower().endswith((".jpg", ".png")):
+            continue
+        portrait = cv2.imread(os.path.join(DATASET_DIR, filename))[:, :, ::-1]
+        portrait = cv2.resize(portrait, None, fx=face_zoom, fy=face_zoom, interpolation=cv2.INTER_CUBIC)
+        canvas = np.full((height, width, 3), 127, dtype=np.uint8)
+        y = (height - portrait.shape[0]) // 2
+        x = (width - portrait.shape[1]) // 3
+        canvas[y:y + portrait.shape[0], x:x + portrait.shape[1]] = portrait
+        scenes.append((os.path.splitext(filename)[0], canvas))
+    return scenes
+
+
+def run(scales=DEFAULT_SCALES, canvas_size=(1920, 1080), face_zoom=1.5):
+    names, encodings, _, _ = FaceEncodingCache(DATASET_DIR).refresh()
+    matcher = FaceMatcher(names, encodings)
+    scenes = make_scenes(canvas_size, face_zoom)
+
+    results = []
+    for scale in scales:
+        hits = 0
+        elapsed = 0.0
+        for code, image in scenes:
+            start = time.perf_counter()
+            _, face_encodings = detect_and_encode(image, scale)
+            elapsed += time.perf_counter() - start
+            if code in matcher.identify(face_encodings):
+                hits += 1
+        results.append({
+            "scale": scale,
+            "effective_scale": resolve_detection_scale(scenes[0][1].shape, scale),
+            "ms_per_image": elapsed / len(scenes) * 1000,
+            "recall": hits / len(scenes),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--canvas", default="1920x1080", help="tamaño del lienzo, ANCHOxALTO")
+    parser.add_argument("--face-zoom", type=float, default=1.5, help="ampliación de la foto de referencia")
+    args = parser.parse_args()
+    canvas_size = tuple(int(v) for v in args.canvas.lower().split("x"))
+
+    rows = run(canvas_size=canvas_size, face_zoom=args.face_zoom)
+    base = rows[0]["ms_per_image"]
+    print(f"{'escala':>8} {'efectiva':>9} {'ms/imagen':>10} {'mejora':>7} {'recall':>7}")
+    for row in rows:
+        print(f"{str(row['scale']):>8} {row['effective_scale']:>9.2f} {row['ms_per_image']:>10.1f} "
+              f"{base / row['ms_per_image']:>6.1f}x {row['recall']:>7.0%}")
+
+
+if __name__ == "__main__":
+    main()
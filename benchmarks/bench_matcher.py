@@ -0,0 +1,92 @@
+"""
+Benchmark de comparación contra la galería.
+
+Compara el camino anterior (compare_faces + face_distance por cada rostro sobre
+una lista de Python) con FaceMatcher.match, que procesa todos los rostros de un
+frame en una sola llamada. Usa galerías sintéticas de 100 a 100 000 rostros.
+
+Uso:
+    python benchmarks/bench_matcher.py [--faces 5] [--repeats 20]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import face_recognition
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from attendance_app import FaceMatcher, MATCH_TOLERANCE
+
+DEFAULT_SIZES = (100, 1_000, 10_000, 100_000)
+
+
+def synthetic_encodings(n, rng):
+    """Codificaciones aleatorias con la misma escala que las de dlib (norma ~1)."""
+    enc = rng.normal(size=(n, 128))
+    enc /= np.linalg.norm(enc, axis=1, keepdims=True)
+    return enc
+
+
+def legacy_match(known_face_encodings, known_face_names, face_encodings):
+    """Réplica del bucle original de process_image/process_video/take_photo."""
+    found = []
+    for face_encoding in face_encodings:
+        matches = face_recognition.compare_faces(known_face_encodings, face_encoding, tolerance=MATCH_TOLERANCE)
+        face_distances = face_recognition.face_distance(known_face_encodings, face_encoding)
+        if True in matches:
+            best_match_index = np.argmin(face_distances)
+            if matches[best_match_index]:
+                found.append(known_face_names[best_match_index])
+    return found
+
+
+def _best_time(fn, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(sizes=DEFAULT_SIZES, faces_per_frame=5, repeats=20, seed=0):
+    rng = np.random.default_rng(seed)
+    results = []
+    for size in sizes:
+        gallery = synthetic_encodings(size, rng)
+        names = [str(i) for i in range(size)]
+        known_list = list(gallery)
+        # Rostros consultados: copias ruidosas de miembros de la galería
+        picks = rng.choice(size, faces_per_frame, replace=False)
+        queries = gallery[picks] + rng.normal(scale=0.01, size=(faces_per_frame, 128))
+
+        matcher = FaceMatcher(names, gallery)
+        assert matcher.identify(queries) == legacy_match(known_list, names, queries)
+
+        legacy = _best_time(lambda: legacy_match(known_list, names, queries), repeats)
+        vectorized = _best_time(lambda: matcher.match(queries), repeats)
+        results.append({
+            "gallery_size": size,
+            "faces_per_frame": faces_per_frame,
+            "legacy_ms": legacy * 1000,
+            "matcher_ms": vectorized * 1000,
+            "speedup": legacy / vectorized,
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--faces", type=int, default=5, help="rostros por frame")
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'galería':>10} {'anterior (ms)':>14} {'FaceMatcher (ms)':>17} {'mejora':>8}")
+    for row in run(faces_per_frame=args.faces, repeats=args.repeats):
+        print(f"{row['gallery_size']:>10} {row['legacy_ms']:>14.3f} {row['matcher_ms']:>17.3f} {row['speedup']:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
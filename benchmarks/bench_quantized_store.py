@@ -0,0 +1,114 @@
+"""
+Benchmark de la galería cuantizada (QuantizedFaceMatcher) frente a FaceMatcher.
+
+Informa la memoria de cada formato (lista de arreglos float64 como
+known_face_encodings, matriz float32 de FaceMatcher, e int8/float16 con
+re-ranking float32 leído del disco con memoria mapeada), la concordancia con
+la búsqueda exacta y el tiempo por frame. Las galerías sintéticas imitan a las
+de dlib: un vector medio común más la variación de cada persona (distancia
+típica entre personas ~0.8); los rostros consultados son alumnos de la galería
+a ~0.35 de su codificación y desconocidos que deben rechazarse.
+
+Uso:
+    python benchmarks/bench_quantized_store.py [--sizes 10000 200000] [--top-k 16]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from attendance_app import FaceMatcher, QuantizedFaceMatcher, QUANTIZED_RERANK_TOP_K
+
+DEFAULT_SIZES = (10_000, 50_000, 200_000)
+
+
+def dlib_like_encodings(n, rng, mean):
+    return (mean + rng.normal(scale=0.05, size=(n, 128))).astype(np.float32)
+
+
+def make_queries(gallery, count, rng, mean):
+    """Mitad alumnos de la galería (con la variación de otra foto), mitad desconocidos."""
+    known = count - count // 2
+    picks = rng.choice(len(gallery), known, replace=False)
+    noise = rng.normal(size=(known, 128))
+    noise *= 0.35 / np.linalg.norm(noise, axis=1, keepdims=True)
+    strangers = dlib_like_encodings(count // 2, rng, mean)
+    return np.concatenate([gallery[picks] + noise, strangers]).astype(np.float32)
+
+
+def list_of_float64_bytes(size):
+    """Memoria de una lista de Python con un arreglo float64 de 128 valores por rostro."""
+    one = np.zeros(128)
+    return size * (sys.getsizeof(one) + 8)
+
+
+def _best_time(fn, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(sizes=DEFAULT_SIZES, queries=200, faces_per_frame=5, top_k=QUANTIZED_RERANK_TOP_K, repeats=5, seed=0):
+    rng = np.random.default_rng(seed)
+    mean = rng.normal(scale=0.09, size=128)
+    results = []
+    for size in sizes:
+        gallery = dlib_like_encodings(size, rng, mean)
+        names = [str(i) for i in range(size)]
+        probe = make_queries(gallery, queries, rng, mean)
+        frame = probe[:faces_per_frame]
+
+        exact = FaceMatcher(names, gallery)
+        exact_idx, _, exact_ok = exact.match(probe)
+        row = {
+            "gallery_size": size,
+            "list_float64_bytes": list_of_float64_bytes(size),
+            "float32_bytes": exact.gallery.nbytes + exact.gallery_sq_norms.nbytes,
+            "exact_ms": _best_time(lambda: exact.match(frame), repeats) * 1000,
+        }
+        for fmt in ("int8", "float16"):
+            with tempfile.TemporaryDirectory() as directory:
+                QuantizedFaceMatcher.build(names, gallery, fmt).save(directory)
+                store = QuantizedFaceMatcher.load(directory, top_k=top_k)
+                idx, _, ok = store.match(probe)
+                footprint = store.nbytes()
+                row[f"{fmt}_coarse_bytes"] = footprint["coarse"]
+                row[f"{fmt}_exact_bytes_on_disk"] = footprint["exact"]
+                # Recall@1: mismo rostro más cercano que la búsqueda exacta
+                row[f"{fmt}_recall_at_1"] = float(np.mean(idx == exact_idx))
+                row[f"{fmt}_same_decision"] = float(np.mean((ok == exact_ok) & (~ok | (idx == exact_idx))))
+                row[f"{fmt}_ms"] = _best_time(lambda: store.match(frame), repeats) * 1000
+                del store
+        results.append(row)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument("--queries", type=int, default=200, help="rostros consultados para medir la concordancia")
+    parser.add_argument("--faces", type=int, default=5, help="rostros por frame al medir el tiempo")
+    parser.add_argument("--top-k", type=int, default=QUANTIZED_RERANK_TOP_K)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    mb = 1024 * 1024
+    print(f"{'galería':>8} {'list f64':>9} {'f32':>8} {'int8':>8} {'f16':>8} "
+          f"{'recall int8':>11} {'recall f16':>10} {'exacta':>9} {'int8':>9} {'f16':>9}")
+    for row in run(args.sizes, args.queries, args.faces, args.top_k, args.repeats):
+        print(f"{row['gallery_size']:>8} {row['list_float64_bytes'] / mb:>7.1f}MB {row['float32_bytes'] / mb:>6.1f}MB "
+              f"{row['int8_coarse_bytes'] / mb:>6.1f}MB {row['float16_coarse_bytes'] / mb:>6.1f}MB "
+              f"{row['int8_recall_at_1']:>11.3f} {row['float16_recall_at_1']:>10.3f} "
+              f"{row['exact_ms']:>7.2f}ms {row['int8_ms']:>7.2f}ms {row['float16_ms']:>7.2f}ms")
+    print("Memoria de búsqueda: int8/f16 = matriz cuantizada + normas; el float32 del re-ranking queda en disco (mmap).")
+
+
+if __name__ == "__main__":
+    main()
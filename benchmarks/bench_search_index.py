@@ -0,0 +1,103 @@
+"""
+Benchmark de los buscadores de rostros: comparación exacta (FaceMatcher, la
+referencia) frente al índice IVF (IVFFaceMatcher) con distintas listas
+revisadas (n_probe).
+
+Para cada tamaño de galería informa el recall@1 de los alumnos consultados
+(mismo rostro que la búsqueda exacta), la concordancia de decisiones también
+con desconocidos, el tiempo por frame, y cuánto tarda entrenar el índice,
+abrirlo desde el disco y agregar un alumno. Usa las galerías sintéticas con
+estadísticas de dlib de bench_quantized_store.py.
+
+Uso:
+    python benchmarks/bench_search_index.py [--sizes 20000 200000] [--n-probe 4 12 32]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from attendance_app import FaceMatcher, IVFFaceMatcher, IVF_N_PROBE
+from bench_quantized_store import dlib_like_encodings, make_queries
+
+DEFAULT_SIZES = (20_000, 50_000, 200_000)
+DEFAULT_N_PROBE = (4, IVF_N_PROBE, 32)
+
+
+def _best_time(fn, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(sizes=DEFAULT_SIZES, n_probes=DEFAULT_N_PROBE, queries=200, faces_per_frame=5, repeats=5, seed=0):
+    rng = np.random.default_rng(seed)
+    mean = rng.normal(scale=0.09, size=128)
+    results = []
+    for size in sizes:
+        gallery = dlib_like_encodings(size, rng, mean)
+        names = [str(i) for i in range(size)]
+        probe = make_queries(gallery, queries, rng, mean)
+        known = queries - queries // 2  # make_queries pone primero a los alumnos de la galería
+        frame = probe[:faces_per_frame]
+
+        exact = FaceMatcher(names, gallery)
+        exact_idx, _, exact_ok = exact.match(probe)
+        exact_ms = _best_time(lambda: exact.match(frame), repeats) * 1000
+
+        with tempfile.TemporaryDirectory() as directory:
+            start = time.perf_counter()
+            IVFFaceMatcher.open_or_build(directory, names, gallery)
+            build_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            index = IVFFaceMatcher.open_or_build(directory, names, gallery)
+            open_seconds = time.perf_counter() - start
+            new_face = dlib_like_encodings(1, rng, mean)
+            add_ms = _best_time(lambda: index.extended(["nuevo"], new_face), repeats) * 1000
+
+            for n_probe in n_probes:
+                index.n_probe = n_probe
+                idx, _, ok = index.match(probe)
+                results.append({
+                    "gallery_size": size,
+                    "lists": len(index.lists),
+                    "n_probe": n_probe,
+                    "recall_at_1": float(np.mean(idx[:known] == exact_idx[:known])),
+                    "same_decision": float(np.mean((ok == exact_ok) & (~ok | (idx == exact_idx)))),
+                    "exact_ms": exact_ms,
+                    "ivf_ms": _best_time(lambda: index.match(frame), repeats) * 1000,
+                    "build_s": build_seconds,
+                    "open_s": open_seconds,
+                    "add_student_ms": add_ms,
+                })
+            del index
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument("--n-probe", type=int, nargs="+", default=list(DEFAULT_N_PROBE))
+    parser.add_argument("--queries", type=int, default=200, help="rostros consultados para medir el recall")
+    parser.add_argument("--faces", type=int, default=5, help="rostros por frame al medir el tiempo")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'galería':>8} {'listas':>6} {'n_probe':>7} {'recall@1':>8} {'decisión':>8} {'exacta':>9} {'IVF':>9} "
+          f"{'entrenar':>8} {'abrir':>7} {'alta':>8}")
+    for row in run(args.sizes, args.n_probe, args.queries, args.faces, args.repeats):
+        print(f"{row['gallery_size']:>8} {row['lists']:>6} {row['n_probe']:>7} {row['recall_at_1']:>8.3f} "
+              f"{row['same_decision']:>8.3f} {row['exact_ms']:>7.2f}ms {row['ivf_ms']:>7.2f}ms "
+              f"{row['build_s']:>7.1f}s {row['open_s']:>6.2f}s {row['add_student_ms']:>6.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
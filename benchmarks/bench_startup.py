@@ -0,0 +1,93 @@
+"""
+Tiempo de arranque: importación de attendance_app y tiempo hasta la primera ventana.
+
+Cada medición corre en un proceso nuevo para que no influyan los módulos ya
+cargados. Se compara la importación de attendance_app (con cv2,
+face_recognition, numpy y pandas diferidos) con la de esos módulos pesados,
+que es lo que antes se pagaba siempre al iniciar. El tiempo hasta la primera
+ventana crea el LoginApp y espera a que Tk lo dibuje; necesita pantalla y se
+omite si no la hay. También se informa cuánto tarda la precarga en segundo
+plano de modelos y galería.
+
+Uso:
+    python benchmarks/bench_startup.py [--repeats 5]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_APP = """
+import json, time
+start = time.perf_counter()
+import attendance_app
+print(json.dumps({"seconds": time.perf_counter() - start}))
+"""
+
+IMPORT_HEAVY = """
+import json, time
+start = time.perf_counter()
+import cv2, face_recognition, numpy, pandas
+print(json.dumps({"seconds": time.perf_counter() - start}))
+"""
+
+FIRST_WINDOW = """
+import json, time
+start = time.perf_counter()
+import tkinter as tk
+import attendance_app
+root = tk.Tk()
+attendance_app.LoginApp(root)
+root.update()
+first_window = time.perf_counter() - start
+attendance_app.wait_for_warm_up()
+warm_up = time.perf_counter() - start
+root.destroy()
+print(json.dumps({"seconds": first_window, "warm_up_seconds": warm_up}))
+"""
+
+
+def _run_child(code):
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def _best(code, repeats):
+    runs = [r for r in (_run_child(code) for _ in range(repeats)) if r is not None]
+    if not runs:
+        return None
+    return min(runs, key=lambda r: r["seconds"])
+
+
+def run(repeats=5):
+    return {
+        "import_app": _best(IMPORT_APP, repeats),
+        "import_heavy_modules": _best(IMPORT_HEAVY, repeats),
+        "first_window": _best(FIRST_WINDOW, repeats),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    results = run(args.repeats)
+    app, heavy, window = results["import_app"], results["import_heavy_modules"], results["first_window"]
+    print(f"import attendance_app:                   {app['seconds'] * 1000:8.0f} ms")
+    if heavy is not None:
+        print(f"import cv2/face_recognition/numpy/pandas: {heavy['seconds'] * 1000:8.0f} ms (ya no se paga al iniciar)")
+    if window is None:
+        print("Primera ventana: no se pudo medir (¿sin pantalla?)")
+    else:
+        print(f"Primera ventana de login:                {window['seconds'] * 1000:8.0f} ms")
+        print(f"Precarga de modelos y galería lista a:   {window['warm_up_seconds'] * 1000:8.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Throughput de process_video: camino en serie frente al pipeline paralelo.
+
+Procesa el mismo clip con VideoRecognitionPipeline(workers=0) (equivalente al
+bucle anterior de process_video) y con N procesos trabajadores, e informa los
+frames por segundo de cada uno. Sin --clip se genera un video de prueba con
+las imágenes de dataset/.
+
+Uso:
+    python benchmarks/bench_video_pipeline.py [--clip video.mp4] [--workers 4]
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+import cv2
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+from attendance_app import FaceEncodingCache, FaceMatcher, VideoRecognitionPipeline, VIDEO_PIPELINE_WORKERS
+
+DATASET_DIR = os.path.join(ROOT_DIR, "dataset")
+
+
+def make_test_clip(path, seconds=10, fps=20, size=(1280, 720)):
+    """Escribe un clip que alterna las imágenes de dataset/ sobre un fondo gris."""
+    images = [os.path.join(DATASET_DIR, f) for f in sorted(os.listdir(DATASET_DIR))
+              if f.lower().endswith((".jpg", ".png"))]
+    width, height = size
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), fps, size)
+    for i in range(seconds * fps):
+        canvas = np.full((height, width, 3), 127, dtype=np.uint8)
+        image = cv2.imread(images[(i // fps) % len(images)])
+        scale = min(height / image.shape[0], (width / 2) / image.shape[1])
+        image = cv2.resize(image, None, fx=scale, fy=scale)
+        x = (i * 3) % (width - image.shape[1])
+        canvas[:image.shape[0], x:x + image.shape[1]] = image
+        writer.write(canvas)
+    writer.release()
+    return path
+
+
+def load_matcher():
+    names, encodings, _, _ = FaceEncodingCache(DATASET_DIR).refresh()
+    return FaceMatcher(names, encodings)
+
+
+def run(clip_path, workers=VIDEO_PIPELINE_WORKERS):
+    matcher = load_matcher()
+    results = []
+    for n in (0, workers):
+        pipeline = VideoRecognitionPipeline(matcher.identify, workers=n)
+        found, stats = pipeline.run(clip_path)
+        stats["workers"] = n
+        stats["recognized"] = sorted(found)
+        results.append(stats)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clip", help="video a procesar (por defecto se genera uno)")
+    parser.add_argument("--workers", type=int, default=VIDEO_PIPELINE_WORKERS)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        clip = args.clip or make_test_clip(os.path.join(tmp, "clip.avi"))
+        results = run(clip, args.workers)
+
+    serial = results[0]
+    print(f"{'modo':>12} {'frames':>7} {'segundos':>9} {'fps':>7} {'rostros':>8} {'codificados':>12}")
+    for stats in results:
+        mode = "serie" if stats["workers"] == 0 else f"{stats['workers']} procesos"
+        print(f"{mode:>12} {stats['frames']:>7} {stats['seconds']:>9.2f} {stats['fps']:>7.1f} "
+              f"{stats['faces']:>8} {stats['encodes']:>12}")
+    print(f"Mejora: {results[1]['fps'] / serial['fps']:.2f}x")
+    if results[1]["recognized"] != serial["recognized"]:
+        print("AVISO: los alumnos reconocidos difieren entre ambos modos")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Prueba de carga del servicio de reconocimiento (attendance_app.py serve).
+
+Varios clientes concurrentes envían las imágenes de dataset/ a /recognize y
+se mide el throughput, la latencia por pedido y el tamaño medio de los lotes
+que arma el servicio. Sin --url se levanta un servicio dentro del mismo
+proceso, en un puerto libre.
+
+Uso:
+    python benchmarks/load_test_server.py [--url http://127.0.0.1:8765] [--clients 8] [--requests 200]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+from attendance_app import (FaceEncodingCache, FaceGallery, RecognitionBatcher, RecognitionClient,
+                            RecognitionServer, RECOGNITION_BATCH_WINDOW_MS, VIDEO_PIPELINE_WORKERS)
+
+DATASET_DIR = os.path.join(ROOT_DIR, "dataset")
+
+
+def load_images():
+    images = []
+    for filename in sorted(os.listdir(DATASET_DIR)):
+        if filename.lower().endswith((".jpg", ".png")):
+            with open(os.path.join(DATASET_DIR, filename), "rb") as f:
+                images.append((os.path.splitext(filename)[0], f.read()))
+    return images
+
+
+def start_local_server(workers, batch_window_ms):
+    names, encodings, _, _ = FaceEncodingCache(DATASET_DIR).refresh()
+    batcher = RecognitionBatcher(FaceGallery(names, encodings), workers=workers, batch_window_ms=batch_window_ms)
+    server = RecognitionServer(batcher, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def run(url, clients=8, requests=200):
+    images = load_images()
+    client = RecognitionClient(url)
+    before = client.stats()
+    latencies = []
+    hits = 0
+    errors = 0
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def worker():
+        nonlocal hits, errors
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            code, data = images[i % len(images)]
+            start = time.perf_counter()
+            try:
+                faces = client.recognize(data)
+            except Exception:
+                with lock:
+                    errors += 1
+                continue
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                hits += any(found == code for _, found in faces)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    seconds = time.perf_counter() - start
+
+    after = client.stats()
+    batches = after["batches"] - before["batches"]
+    latencies_ms = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        "clients": clients,
+        "requests": requests,
+        "errors": errors,
+        "seconds": seconds,
+        "requests_per_second": len(latencies) / seconds if seconds else 0.0,
+        "latency_p50_ms": float(np.percentile(latencies_ms, 50)),
+        "latency_p95_ms": float(np.percentile(latencies_ms, 95)),
+        "mean_batch_size": (after["requests"] - before["requests"]) / batches if batches else 0.0,
+        "recall": hits / len(latencies) if latencies else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="servicio ya en ejecución (por defecto se levanta uno local)")
+    parser.add_argument("--clients", type=int, default=8, help="clientes concurrentes")
+    parser.add_argument("--requests", type=int, default=200, help="pedidos en total")
+    parser.add_argument("--workers", type=int, default=VIDEO_PIPELINE_WORKERS, help="trabajadores del servicio local")
+    parser.add_argument("--batch-window-ms", type=int, default=RECOGNITION_BATCH_WINDOW_MS)
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if url is None:
+        server, url = start_local_server(args.workers, args.batch_window_ms)
+    try:
+        row = run(url, args.clients, args.requests)
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+            server.batcher.close()
+
+    print(f"{row['clients']} clientes, {row['requests']} pedidos ({row['errors']} errores) en {row['seconds']:.1f} s")
+    print(f"Throughput: {row['requests_per_second']:.1f} pedidos/s, lote medio: {row['mean_batch_size']:.1f}")
+    print(f"Latencia p50: {row['latency_p50_ms']:.1f} ms, p95: {row['latency_p95_ms']:.1f} ms, "
+          f"recall: {row['recall']:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""
+Suite de benchmarks: arranque, carga de la galería, comparación, imagen y video
+de punta a punta, y escritura de asistencia en SQLite. No necesita cámara ni
+interfaz (el tiempo hasta la primera ventana se omite si no hay pantalla).
+
+Los resultados se guardan en JSON (por defecto en benchmarks/results/) junto con
+el commit, la versión de Python y los núcleos, para comparar corridas:
+
+    python benchmarks/run_benchmarks.py [--quick] [--output resultados.json]
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/anterior.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import attendance_app
+from attendance_app import (AttendanceCsvWriter, AuditLogger, DailyAttendance, Database, FaceEncodingCache,
+                            FaceGallery, detect_and_encode, migrate_attendance_date_column,
+                            record_attendance)
+import bench_matcher
+import bench_search_index
+import bench_startup
+import bench_video_pipeline
+
+import face_recognition
+
+DATASET_DIR = os.path.join(ROOT_DIR, "dataset")
+RESULTS_DIR = os.path.join(ROOT_DIR, "benchmarks", "results")
+MATCH_SIZES = (10, 100, 1_000, 10_000, 100_000)
+
+
+def bench_gallery_load():
+    """Carga en frío (sin caché de codificaciones) y en caliente de dataset/."""
+    with tempfile.TemporaryDirectory() as tmp:
+        dataset = os.path.join(tmp, "dataset")
+        shutil.copytree(DATASET_DIR, dataset)  # La caché queda en tmp/, así que empieza vacía
+
+        start = time.perf_counter()
+        names, encodings, recomputed, _ = FaceEncodingCache(dataset).refresh()
+        cold = time.perf_counter() - start
+
+        start = time.perf_counter()
+        FaceEncodingCache(dataset).refresh()
+        warm = time.perf_counter() - start
+
+    start = time.perf_counter()
+    FaceGallery(names, encodings).full_matcher()
+    matcher = time.perf_counter() - start
+
+    return {"images": recomputed, "cold_ms": cold * 1000, "warm_ms": warm * 1000,
+            "speedup": cold / warm if warm else None, "full_matcher_ms": matcher * 1000}
+
+
+def bench_matching(sizes, repeats):
+    return bench_matcher.run(sizes=sizes, repeats=repeats)
+
+
+def bench_search(sizes, repeats):
+    """Índice IVF con el n_probe por defecto frente a la búsqueda exacta."""
+    return bench_search_index.run(sizes=sizes, n_probes=(attendance_app.IVF_N_PROBE,), repeats=repeats)
+
+
+def bench_images():
+    """Reconocimiento de punta a punta de cada imagen de dataset/ (lectura, detección, comparación)."""
+    names, encodings, _, _ = FaceEncodingCache(DATASET_DIR).refresh()
+    gallery = FaceGallery(names, encodings)
+    paths = [os.path.join(DATASET_DIR, f) for f in sorted(os.listdir(DATASET_DIR))
+             if f.lower().endswith((".jpg", ".png"))]
+    hits = 0
+    start = time.perf_counter()
+    for path in paths:
+        image = face_recognition.load_image_file(path)
+        _, face_encodings = detect_and_encode(image)
+        codes = gallery.identify(face_encodings, None, None) if face_encodings else []
+        hits += os.path.splitext(os.path.basename(path))[0] in codes
+    seconds = time.perf_counter() - start
+    return {"images": len(paths), "ms_per_image": seconds / len(paths) * 1000,
+            "images_per_second": len(paths) / seconds, "recall": hits / len(paths)}
+
+
+def bench_video(clip_path, seconds):
+    with tempfile.TemporaryDirectory() as tmp:
+        clip = clip_path or bench_video_pipeline.make_test_clip(os.path.join(tmp, "clip.avi"), seconds=seconds)
+        return bench_video_pipeline.run(clip)
+
+
+def bench_attendance_writes(batch_sizes, repeats):
+    """
+    Tiempo de record_attendance (transacción SQLite + CSV con fsync) sobre una
+    copia migrada de la base de datos, para lotes de distinto tamaño. La copia
+    se hace con la API de backup de SQLite, que incluye lo que aún está en el
+    WAL (copiar el archivo no). Los eventos de auditoría van a un AuditLogger
+    propio que se cierra al final, así su hilo cierra la conexión a la copia.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "attendance.db")
+        source = sqlite3.connect(os.path.join(ROOT_DIR, attendance_app.DB_PATH))
+        copy = sqlite3.connect(db_path)
+        try:
+            source.backup(copy)
+        finally:
+            copy.close()
+            source.close()
+        original_db, original_audit = attendance_app.db, attendance_app.audit_logger
+        attendance_app.db = Database(db_path)
+        attendance_app.audit_logger = AuditLogger()
+        csv_writer = AttendanceCsvWriter(tmp)
+        try:
+            migrate_attendance_date_column()
+            codes = [row[0] for row in attendance_app.db.fetchall("SELECT student_code FROM students")]
+            results = []
+            for size in batch_sizes:
+                batch = codes[:size]
+                times = []
+                for _ in range(repeats):
+                    attendance_app.db.execute("DELETE FROM attendance WHERE date = ?",
+                                              (datetime.now().strftime("%Y-%m-%d"),))
+                    today = DailyAttendance()
+                    start = time.perf_counter()
+                    record_attendance(batch, today, csv_writer, "benchmark", None, None)
+                    times.append(time.perf_counter() - start)
+                results.append({"batch_size": len(batch), "ms_per_batch": float(np.median(times)) * 1000,
+                                "ms_per_student": float(np.median(times)) * 1000 / max(1, len(batch))})
+        finally:
+            attendance_app.audit_logger.close()
+            csv_writer.close()
+            attendance_app.db.close()
+            attendance_app.db, attendance_app.audit_logger = original_db, original_audit
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(quick=False, clip_path=None):
+    return {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "quick": quick,
+        },
+        "startup": bench_startup.run(1 if quick else 5),
+        "gallery_load": bench_gallery_load(),
+        "matching": bench_matching(MATCH_SIZES[:3] if quick else MATCH_SIZES, 3 if quick else 20),
+        "search_index": bench_search((20_000,) if quick else (20_000, 200_000), 3 if quick else 5),
+        "images": bench_images(),
+        "video": bench_video(clip_path, 3 if quick else 10),
+        "attendance_writes": bench_attendance_writes((1, 10, 30), 3 if quick else 10),
+    }
+
+
+def _flatten(value, prefix=""):
+    """{'a': [{'b': 1}]} -> {'a.0.b': 1}, solo con los valores numéricos."""
+    if isinstance(value, dict):
+        items = value.items()
+    elif isinstance(value, list):
+        items = enumerate(value)
+    else:
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return {prefix: value}
+        return {}
+    flat = {}
+    for key, item in items:
+        flat.update(_flatten(item, f"{prefix}.{key}" if prefix else str(key)))
+    return flat
+
+
+def compare(previous, current):
+    """Imprime las métricas que cambiaron respecto de una corrida anterior."""
+    before, after = _flatten(previous), _flatten(current)
+    print(f"Comparación con {previous['meta'].get('commit')} ({previous['meta'].get('date')}):")
+    for key in sorted(after):
+        if key.startswith("meta.") or key not in before or before[key] == after[key]:
+            continue
+        ratio = after[key] / before[key] if before[key] else float("inf")
+        print(f"  {key:<40} {before[key]:>12.3f} -> {after[key]:>12.3f} ({ratio:.2f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="tamaños y repeticiones reducidos")
+    parser.add_argument("--clip", help="video a procesar (por defecto se genera uno)")
+    parser.add_argument("--output", help="archivo JSON de salida (por defecto benchmarks/results/FECHA_COMMIT.json)")
+    parser.add_argument("--compare", help="JSON de una corrida anterior para comparar")
+    args = parser.parse_args()
+
+    results = run(quick=args.quick, clip_path=args.clip)
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"{stamp}_{results['meta']['commit'] or 'local'}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+
+    startup = results["startup"]
+    print(f"Importación de attendance_app: {startup['import_app']['seconds'] * 1000:.0f} ms")
+    if startup["first_window"] is not None:
+        print(f"Primera ventana de login: {startup['first_window']['seconds'] * 1000:.0f} ms")
+    load = results["gallery_load"]
+    print(f"Galería ({load['images']} imágenes): frío {load['cold_ms']:.0f} ms, caliente {load['warm_ms']:.1f} ms")
+    for row in results["matching"]:
+        print(f"Comparación, galería {row['gallery_size']:>7}: {row['matcher_ms']:.3f} ms "
+              f"({row['speedup']:.1f}x frente al bucle anterior)")
+    for row in results["search_index"]:
+        print(f"Índice IVF, galería {row['gallery_size']:>7}: {row['ivf_ms']:.2f} ms frente a {row['exact_ms']:.2f} ms "
+              f"exacta, recall@1 {row['recall_at_1']:.3f}")
+    images = results["images"]
+    print(f"Imágenes: {images['ms_per_image']:.1f} ms/imagen, recall {images['recall']:.0%}")
+    for stats in results["video"]:
+        print(f"Video con {stats['workers']} trabajadores: {stats['fps']:.1f} fps")
+    for row in results["attendance_writes"]:
+        print(f"Registro de asistencia, lote de {row['batch_size']:>2}: {row['ms_per_batch']:.2f} ms")
+    print(f"Resultados guardados en {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(json.load(f), results)
+
+
+if __name__ == "__main__":
+    main()